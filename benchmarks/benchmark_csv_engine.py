@@ -0,0 +1,40 @@
+"""
+Benchmark reading the export with the csv engines of TypedCsvParser (pandas and pyarrow) on synthetic exports. Both
+engines must give the same df. Requires pyarrow. Usage (from the project root):
+    python -m benchmarks.benchmark_csv_engine --rows 100000 1000000 10000000
+"""
+from benchmarks.synthetic_export import create_synthetic_export
+from converter.csv_parser import TypedCsvParser
+from pathlib import Path
+from typing import List
+
+import argparse
+import pandas as pd
+import tempfile
+import time
+
+
+def benchmark_csv_engine(nr_rows_list: List[int]) -> None:
+    assert TypedCsvParser.is_pyarrow_installed(), "this benchmark requires 'pip install pyarrow'"
+    for nr_rows in nr_rows_list:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = create_synthetic_export(csv_path=Path(tmp_dir) / "synthetic_export.csv", nr_rows=nr_rows)
+            seconds = {}
+            dfs = {}
+            for engine in TypedCsvParser.engines:
+                start = time.perf_counter()
+                dfs[engine] = TypedCsvParser(path=csv_path, engine=engine).read()
+                seconds[engine] = time.perf_counter() - start
+        pd.testing.assert_frame_equal(dfs["pyarrow"], dfs["pandas"])
+        speedup = seconds["pandas"] / seconds["pyarrow"]
+        print(
+            f"rows={nr_rows:>9}  pandas={seconds['pandas']:7.2f}s  pyarrow={seconds['pyarrow']:7.2f}s  "
+            f"speedup={speedup:5.2f}  identical=True"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100 * 1000, 1000 * 1000])
+    args = parser.parse_args()
+    benchmark_csv_engine(nr_rows_list=args.rows)
@@ -0,0 +1,67 @@
+"""
+Measure the cold-start import time of modules, each in a fresh python interpreter (median of --repeat runs). By
+default the app startup (main, converter.constants) is compared with the import of the csv reader
+(converter.csv_parser, imports pandas) and the reader of hdsr_wis_config_reader (only if that package is installed).
+With --check-budget we exit with an error if a module in IMPORT_TIME_BUDGETS is slower than its budget, so that a
+heavy import (e.g. pandas) that creeps back into the startup is noticed. Usage (from the project root):
+    python -m benchmarks.benchmark_import_time --repeat 10 --check-budget
+"""
+from typing import Dict
+from typing import List
+
+import argparse
+import importlib.util
+import statistics
+import subprocess
+import sys
+
+
+DEFAULT_MODULES = ["main", "converter.constants", "converter.csv_parser", "hdsr_wis_config_reader.utils"]
+
+# startup must not import numpy, pandas or touch the network drive: these take >0.3s (without is ~0.03s)
+IMPORT_TIME_BUDGETS = {
+    "main": 0.15,
+    "converter.constants": 0.05,
+}
+
+
+def get_import_seconds(module: str, repeat: int) -> float:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    seconds = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+        seconds.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(seconds)
+
+
+def benchmark_import_time(modules: List[str], repeat: int) -> Dict[str, float]:
+    import_seconds = {}
+    for module in modules:
+        if importlib.util.find_spec(module.split(".")[0]) is None:
+            print(f"{module:<40} not installed")
+            continue
+        import_seconds[module] = get_import_seconds(module=module, repeat=repeat)
+        budget = IMPORT_TIME_BUDGETS.get(module)
+        budget_str = f" (budget {budget:.3f}s)" if budget else ""
+        print(f"{module:<40} {import_seconds[module]:.3f}s{budget_str}")
+    return import_seconds
+
+
+def get_over_budget(import_seconds: Dict[str, float]) -> List[str]:
+    return [
+        f"{module} {seconds:.3f}s > {IMPORT_TIME_BUDGETS[module]:.3f}s"
+        for module, seconds in import_seconds.items()
+        if module in IMPORT_TIME_BUDGETS and seconds > IMPORT_TIME_BUDGETS[module]
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check-budget", action="store_true", help="exit with an error if over IMPORT_TIME_BUDGETS")
+    args = parser.parse_args()
+    _import_seconds = benchmark_import_time(modules=args.modules, repeat=args.repeat)
+    over_budget = get_over_budget(import_seconds=_import_seconds)
+    if args.check_budget and over_budget:
+        sys.exit(f"import time over budget: {over_budget}")
@@ -0,0 +1,46 @@
+"""
+Benchmark the .xml creation (ConvertCsvToXml._create_xml) with 1 to N worker processes on a synthetic export.
+Each run must create an .xml that is byte-identical to the sequential .xml. Usage (from the project root):
+    python -m benchmarks.benchmark_xml_workers --rows 200000 --workers 1 2 4 8 16
+"""
+from benchmarks.synthetic_export import create_synthetic_export
+from converter.convert import ConvertCsvToXml
+from pathlib import Path
+
+import argparse
+import filecmp
+import tempfile
+import time
+
+
+def benchmark_xml_workers(nr_rows: int, workers_list: list) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        csv_path = create_synthetic_export(csv_path=tmp_dir / "synthetic_export.csv", nr_rows=nr_rows)
+        data_converter = ConvertCsvToXml(orig_csv_path=csv_path)
+        data_converter._outputdir = tmp_dir
+        data_converter.validate_df()
+        nr_pgids = data_converter.df[data_converter.col_pgid].nunique()
+        print(f"synthetic export: {len(data_converter.df)} rows, {nr_pgids} pgids")
+
+        sequential_xml_path = None
+        sequential_seconds = None
+        for workers in workers_list:
+            data_converter.workers = workers
+            start = time.perf_counter()
+            _, xml_path = data_converter._create_xml(xml_path=tmp_dir / f"workers_{workers}.xml")
+            seconds = time.perf_counter() - start
+            if sequential_xml_path is None:
+                sequential_xml_path, sequential_seconds = xml_path, seconds
+            is_identical = filecmp.cmp(f1=sequential_xml_path, f2=xml_path, shallow=False)
+            assert is_identical, f"xml with {workers} workers differs from xml with {workers_list[0]} workers"
+            speedup = sequential_seconds / seconds
+            print(f"workers={workers:>3}  {seconds:7.2f}s  speedup={speedup:5.2f}  identical={is_identical}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200 * 1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+    benchmark_xml_workers(nr_rows=args.rows, workers_list=args.workers)
@@ -0,0 +1,41 @@
+"""
+Compare the memory use of the default and the compact layout (ColumnNameDtypeConstants.compact_dtypes) of the parsed
+export on a synthetic export, and check that both layouts write the same csv. Usage (from the project root):
+    python -m benchmarks.memory_report_compact --rows 1000000
+"""
+from benchmarks.synthetic_export import create_synthetic_export
+from converter.csv_parser import TypedCsvParser
+from pathlib import Path
+
+import argparse
+import pandas as pd
+import tempfile
+
+
+def memory_report_compact(nr_rows: int) -> pd.DataFrame:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = create_synthetic_export(csv_path=Path(tmp_dir) / "synthetic_export.csv", nr_rows=nr_rows)
+        df_default = TypedCsvParser(path=csv_path).read()
+    df_compact = TypedCsvParser.to_compact(df=df_default.copy())
+    assert df_compact.to_csv(index=False) == df_default.to_csv(index=False), "compact layout changes the csv"
+
+    mb = 1024 * 1024
+    df_report = pd.DataFrame(
+        {
+            "default dtype": df_default.dtypes.astype(str),
+            "default MB": df_default.memory_usage(index=False, deep=True) / mb,
+            "compact dtype": df_compact.dtypes.astype(str),
+            "compact MB": df_compact.memory_usage(index=False, deep=True) / mb,
+        }
+    )
+    df_report.loc["total"] = ["", df_report["default MB"].sum(), "", df_report["compact MB"].sum()]
+    return df_report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000 * 1000)
+    args = parser.parse_args()
+    report = memory_report_compact(nr_rows=args.rows)
+    print(report.to_string(float_format="{:.1f}".format))
+    print(f"compact / default = {report.loc['total', 'compact MB'] / report.loc['total', 'default MB']:.2f}")
@@ -0,0 +1,50 @@
+"""Create a synthetic (valid) peilmarges export .csv, e.g. with 1 million rows, to benchmark the converter."""
+from converter.constants import ColumnNameDtypeConstants
+from datetime import date
+from datetime import timedelta
+from pathlib import Path
+
+import argparse
+import random
+
+
+# (eind_winter, begin_zomer, eind_zomer, begin_winter) of the generated pgids, most pgids have the default seasons
+SEASONS = [("01-04", "01-05", "01-09", "01-10")] * 6 + [
+    ("15-03", "15-04", "15-09", "15-10"),
+    ("1-1", "02-01", "30-12", "31-12"),
+    ("28-02", "01-03", "31-08", "01-09"),
+]
+
+
+def create_synthetic_export(csv_path: Path, nr_rows: int, seed: int = 0) -> Path:
+    """Write ~nr_rows csv rows (like the GIS export: ';' separated, dates as yyyymmdd) in random pgid order."""
+    rng = random.Random(seed)
+    lines = [";".join(ColumnNameDtypeConstants.all_cols)]
+    pgid_number = 0
+    while len(lines) <= nr_rows:  # the last pgid is not truncated (that could create a gap between its rows)
+        pgid_number += 1
+        seasons = rng.choice(SEASONS)
+        startdatum = date(year=1990, month=1, day=1) + timedelta(days=rng.randint(0, 15000))
+        pgid_lines = []
+        for _ in range(rng.choice([1, 1, 1, 2, 3, 5])):
+            einddatum = startdatum + timedelta(days=rng.choice([1, 365, rng.randint(2, 4000)]))
+            zomerpeil = round(rng.uniform(-3, 3), 2)
+            winterpeil = round(zomerpeil - rng.choice([0, 0.1, 0.2]), 2)
+            pgid_lines.append(
+                f"PG{pgid_number:07d};{startdatum:%Y%m%d};{einddatum:%Y%m%d};{';'.join(seasons)};"
+                f"{zomerpeil};{winterpeil};25;10;10;25"
+            )
+            startdatum = einddatum
+        rng.shuffle(pgid_lines)  # the rows of a pgid are not sorted in the GIS export either
+        lines.extend(pgid_lines)
+    csv_path.write_text("\n".join(lines) + "\n")
+    return csv_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("csv_path", type=Path)
+    parser.add_argument("--rows", type=int, default=1000 * 1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    create_synthetic_export(csv_path=args.csv_path, nr_rows=args.rows, seed=args.seed)
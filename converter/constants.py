@@ -1,7 +1,11 @@
+from datetime import date
+from datetime import timedelta
 from enum import Enum
 from pathlib import Path
+from typing import Dict
+from typing import Tuple
 
-import numpy as np
+import functools
 
 
 # USER_SETTINGS
@@ -19,9 +23,14 @@ DATA_OUTPUT_DIR = DATA_DIR / "output"
 DATA_EXAMPLE_DIR = DATA_DIR / "example"
 LOG_DIR = DATA_OUTPUT_DIR / "log_rotating"
 LOG_FILE_PATH = LOG_DIR / "main.log"
+CSV_CACHE_DIR = DATA_OUTPUT_DIR / "csv_cache"
+STAGING_DIR = DATA_OUTPUT_DIR / "staging"
+EXPORT_INDEX_PATH = DATA_OUTPUT_DIR / "gis_export_index.json"  # {export dir: {csv name: ctime}}
 DATA_DIR_TEST_INPUT = CONVERTER_DIR / "tests" / "data" / "input"
 PATH_CSV_TEST_INPUT = DATA_DIR_TEST_INPUT / "Koppeling_AAP_20221108.csv"
 PATH_XML_TEST_EXPECTED_OUTPUT = DATA_DIR_TEST_INPUT / "expected_small.xml"
+PATH_CSV_TEST_INPUT_WITH_ERRORS = DATA_DIR_TEST_INPUT / "Koppeling_AAP_with_errors.csv"
+PATH_CSV_TEST_EXPECTED_ORIG_WITH_ERRORS = DATA_DIR_TEST_INPUT / "expected_orig_with_errors.csv"
 
 MIN_ALLOWED_MNAP = -10
 MAX_ALLOWED_MNAP = 10
@@ -30,6 +39,15 @@ MAX_ALLOW_LOWER_MARGIN_CM = 100 * 10  # yes... 10 meters
 MIN_ALLOW_UPPER_MARGIN_CM = 0
 MAX_ALLOW_UPPER_MARGIN_CM = 100 * 10  # yes... 10 meters
 TAB = "    "
+XML_WRITE_BUFFER_SIZE = 1024 * 1024 * 8  # 8 MB
+STREAMING_CHUNK_SIZE = 1000 * 200  # nr csv rows that are read at once in streaming mode
+STREAMING_BLOCK_SIZE = 1000 * 10  # nr rows per spilled block in streaming mode
+ERROR_CSV_CHUNK_SIZE = 1000 * 100  # nr rows per chunk of orig_with_errors.csv of which the errors are rendered at once
+XML_CHUNKS_PER_WORKER = 8  # with --workers N the pgids are split in N * XML_CHUNKS_PER_WORKER chunks
+XML_EVENT_TABLE_CHUNK_SIZE = 1000 * 10  # nr csv rows (of whole pgids) of which the xml events are computed at once
+CSV_CACHE_MAX_SIZE_BYTES = 1024 * 1024 * 1024  # 1 GB, least recently used parsed csvs are removed (see --cache)
+STAGING_BLOCK_SIZE = 1024 * 1024 * 16  # 16 MB, network drive files are copied to local disk in blocks of this size
+STAGING_MAX_SIZE_BYTES = 1024 * 1024 * 1024  # 1 GB, least recently used local copies are removed (see --local-copy)
 
 
 class ColumnNameDtypeConstants:
@@ -63,22 +81,37 @@ class ColumnNameDtypeConstants:
         col_2e_marge_boven,
     ]
 
+    # applied while parsing the csv (see csv_parser.TypedCsvParser). Numpy dtypes are given by name, so that importing
+    # constants does not import numpy
     dtypes = {
         col_pgid: str,
-        col_startdatum: np.datetime64,
-        col_einddatum: np.datetime64,
-        col_eind_winter: str,
-        col_begin_zomer: str,
-        col_eind_zomer: str,
-        col_begin_winter: str,
+        col_startdatum: "datetime64",  # yyyymmdd
+        col_einddatum: "datetime64",  # yyyymmdd
+        col_eind_winter: "category",
+        col_begin_zomer: "category",
+        col_eind_zomer: "category",
+        col_begin_winter: "category",
         col_zomerpeil: float,
         col_winterpeil: float,
-        col_2e_marge_onder: int,
-        col_1e_marge_onder: int,
-        col_1e_marge_boven: int,
-        col_2e_marge_boven: int,
+        col_2e_marge_onder: "Int64",  # nullable int: a cell that is empty or not an integer is NA (a row error)
+        col_1e_marge_onder: "Int64",
+        col_1e_marge_boven: "Int64",
+        col_2e_marge_boven: "Int64",
     }
 
+    # opt-in compact memory layout (see csv_parser.TypedCsvParser.to_compact). A column is only compacted if that is
+    # lossless: peilen must have <= 2 decimals, marges must fit in an int16
+    compact_dtypes = {
+        col_pgid: "category",
+        col_zomerpeil: "float32",
+        col_winterpeil: "float32",
+        col_2e_marge_onder: "Int16",
+        col_1e_marge_onder: "Int16",
+        col_1e_marge_boven: "Int16",
+        col_2e_marge_boven: "Int16",
+    }
+    compact_nr_decimals = 2
+
 
 class DateFormats(Enum):
     yyyymmdd = "%Y%m%d"  # 20001231
@@ -87,6 +120,43 @@ class DateFormats(Enum):
     yyyy_mm_dd = "%Y-%m-%d"  # 2000-12-31
 
 
+@functools.lru_cache(maxsize=None)
+def get_dd_mm_lookup() -> Dict[str, Tuple[int, int, int]]:
+    """
+    Create {<dd-mm string>: (month, day, day_of_year)}, e.g. {'01-04': (4, 1, 92), '1-4': (4, 1, 92), ...}.
+
+    Like datetime.strptime(x, '%d-%m'), we also accept days and months without leading zero. And like strptime
+    (which uses year 1900), '29-02' is not valid. The day_of_year is based on dummy year 2000 (also used for
+    validation) so that day_of_year can be compared to order the season dates.
+    """
+    lookup = {}
+    first_day = date(year=2000, month=1, day=1)
+    for day_of_year in range(1, 367):
+        _date = first_day + timedelta(days=day_of_year - 1)
+        if (_date.month, _date.day) == (2, 29):
+            continue
+        for day_str in (f"{_date.day:02d}", str(_date.day)):
+            for month_str in (f"{_date.month:02d}", str(_date.month)):
+                lookup[f"{day_str}-{month_str}"] = (_date.month, _date.day, day_of_year)
+    return lookup
+
+
+@functools.lru_cache(maxsize=None)
+def get_dd_mm_day_of_year() -> Dict[str, int]:
+    return {dd_mm: day_of_year for dd_mm, (_, _, day_of_year) in get_dd_mm_lookup().items()}
+
+
+def get_month_day_day_of_year(datestr_m_d: str) -> Tuple[int, int, int]:
+    """Parse a dd-mm string (e.g. '01-04') with one dict lookup instead of strptime."""
+    try:
+        return get_dd_mm_lookup()[datestr_m_d]
+    except (KeyError, TypeError):
+        raise AssertionError(
+            f"we expected date format '{DateFormats.dd_mm.value}' so e.g. '01-04' (in other words: April 1), but "
+            f"found {datestr_m_d}"
+        )
+
+
 class TimestampColumns:
     eind_winter = ColumnNameDtypeConstants.col_eind_winter
     begin_zomer = ColumnNameDtypeConstants.col_begin_zomer
@@ -154,14 +224,18 @@ class XmlConstants:
     tweede_bovengrens = TweedeBovengrens()
 
 
-def check_constants():
+@functools.lru_cache(maxsize=None)
+def check_constants() -> None:
+    """
+    Check the local paths once, on first use (e.g. by ConvertCsvToXml.output_dir), not on import. The GIS export
+    (PEILMARGE_GIS_EXPORT_FILE_PATH, often on a slow network drive) is checked when it is read, see
+    csv_parser.TypedCsvParser.separator.
+    """
     assert CONVERTER_DIR.is_dir()
     assert DATA_DIR.is_dir()
     assert DATA_OUTPUT_DIR.is_dir()
     assert LOG_DIR.is_dir()
-    assert PEILMARGE_GIS_EXPORT_FILE_PATH.is_file()
     assert PATH_CSV_TEST_INPUT.is_file()
     assert PATH_XML_TEST_EXPECTED_OUTPUT.is_file()
-
-
-check_constants()
+    assert PATH_CSV_TEST_INPUT_WITH_ERRORS.is_file()
+    assert PATH_CSV_TEST_EXPECTED_ORIG_WITH_ERRORS.is_file()
@@ -1,12 +1,25 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from converter import constants
 from converter.constants import ColumnNameDtypeConstants
 from converter.constants import TAB
+from converter.csv_cache import ParsedCsvCache
+from converter.csv_parser import TypedCsvParser
+from converter.error_store import CsvErrorStore
+from converter.event_table import EventTableBuilder
+from converter.pgid_index import PgidBoundaryIndex
+from converter.utils import atomic_write
 from converter.utils import get_progress
+from converter.validation_rules import ValidationRule
+from converter.validation_rules import ValidationRuleEngine
+from converter.xml_builder import XmlFileWriter
+from converter.xml_builder import XmlFragmentTee
 from converter.xml_builder import XmlSeriesBuilder
 from datetime import datetime
-from hdsr_wis_config_reader.utils import DateColumn
-from hdsr_wis_config_reader.utils import PdReadFlexibleCsv
 from pathlib import Path
+from typing import Dict
+from typing import Iterator
+from typing import List
 from typing import Optional
 from typing import Tuple
 
@@ -17,73 +30,172 @@ import pandas as pd
 logger = logging.getLogger(__name__)
 
 
-class CsvError:
-    def __init__(self, csv_row: int, pgid: str, error_msg: str):
-        self.csv_row = csv_row
-        self.pgid = pgid
-        self.error_msg = error_msg
-        assert "," not in error_msg, "code error. avoid ',' in value (difficult in excel)"
+def _get_xml_fragments(pgid_index: PgidBoundaryIndex) -> List[str]:
+    """Process pool worker: render the xml fragment of each pgid in a chunk of pgids (see iter_xml_fragments)."""
+    return list(ConvertCsvToXml.iter_xml_fragments(pgid_index=pgid_index))
+
+
+def _get_partition_errors(df: pd.DataFrame, collect_all_errors: bool) -> Tuple[CsvErrorStore, Dict[str, float]]:
+    """
+    Process pool worker: evaluate the default validation rules on a partition of the rows (all rows of a pgid are in
+    the same partition). Return the errors and the seconds per rule (see ConvertCsvToXml._add_csv_errors_parallel).
+    """
+    rule_engine = ValidationRuleEngine(
+        rules=ValidationRuleEngine.get_default_rules(with_season_date_rules=collect_all_errors)
+    )
+    error_store = CsvErrorStore()
+    rule_engine.evaluate(df=df, error_store=error_store, level=ValidationRule.level_row)
+    rule_engine.evaluate(df=df, error_store=error_store, level=ValidationRule.level_pgid)
+    return error_store, rule_engine.seconds_per_rule
 
 
 class ConvertCsvToXml(ColumnNameDtypeConstants):
-    def __init__(self, orig_csv_path: Path):
+    def __init__(
+        self,
+        orig_csv_path: Path,
+        workers: int = 1,
+        compact: bool = False,
+        csv_engine: str = "pandas",
+        use_cache: bool = False,
+        collect_all_errors: bool = False,
+    ):
+        """
+        With workers > 1 the csv is validated and the xml is rendered in a pool of worker processes. With compact=True
+        the df uses the compact memory layout (ColumnNameDtypeConstants.compact_dtypes). With csv_engine='pyarrow' the
+        csv is read with the multi-threaded csv reader of pyarrow (see TypedCsvParser.engines). With use_cache=True the
+        parsed csv is loaded from (or saved to) a local cache (see ParsedCsvCache). The output is identical in all
+        cases.
+        With collect_all_errors=True, rows with invalid or unordered season dates (check 1) are reported in
+        orig_with_errors.csv like the other checks, instead of raising for the first of these rows.
+        """
+        assert isinstance(workers, int) and workers >= 1, f"workers must be an int >= 1, but found {workers}"
         self.orig_csv_path = orig_csv_path
+        self.workers = workers
+        self.compact = compact
+        self.csv_engine = csv_engine
+        self.use_cache = use_cache
+        self.collect_all_errors = collect_all_errors
+        rules = ValidationRuleEngine.get_default_rules(with_season_date_rules=collect_all_errors)
+        self.rule_engine = ValidationRuleEngine(rules=rules)
         self._df = None
+        self._pgid_index = None
+        self._invalid_cells = None
         self._csv_rows_no_error = None
         self._output_xml_path = None
         self._outputdir = None
-        self.datecolumn_start = DateColumn(
-            column_name=self.col_startdatum, date_format=constants.DateFormats.yyyymmdd.value,
-        )
-        self.datecolumn_eind = DateColumn(
-            column_name=self.col_einddatum, date_format=constants.DateFormats.yyyymmdd.value,
-        )
 
     @property
     def df(self) -> pd.DataFrame:
         if self._df is not None:
             return self._df
-        reader = PdReadFlexibleCsv(
-            path=self.orig_csv_path.as_posix(),
-            date_columns=[self.datecolumn_start, self.datecolumn_eind],
-            expected_columns=self.all_cols,
-        )
-        self._df = reader.df
-
-        # check dtypes
-        logger.info(f"validate colums and dtype csv {self.orig_csv_path}")
-        for col, dtype in self.dtypes.items():
-            try:
-                self._df[col] = self._df[col].astype(dtype)
-            except Exception as err:
-                logger.error(f"could not convert col {col} to dtype {dtype} because of {err}")
+        logger.info(f"read csv {self.orig_csv_path} with dtypes {self.dtypes}")
+        parser = TypedCsvParser(path=self.orig_csv_path, engine=self.csv_engine)
+        self._df = ParsedCsvCache().read(parser=parser) if self.use_cache else parser.read()
+        self._invalid_cells = parser.invalid_cells
+        if self.compact:
+            self._df = TypedCsvParser.to_compact(df=self._df)
         return self._df
 
     @property
     def output_dir(self) -> Path:
         if self._outputdir:
             return self._outputdir
+        constants.check_constants()
         datetime_str_now = datetime.now().strftime("%Y%m%d_%H%M%S")
         self._outputdir = constants.DATA_OUTPUT_DIR / datetime_str_now
         self._outputdir.mkdir(parents=True, exist_ok=False)
         return self._outputdir
 
-    @staticmethod
-    def get_month_day_from_string(datestr_m_d: str) -> Tuple[int, int]:
-        fmt = constants.DateFormats.dd_mm.value
-        try:
-            date_obj = pd.to_datetime(datestr_m_d, format=fmt)
-        except Exception:
-            raise AssertionError(
-                f"we expected date format '{fmt}' so e.g. '01-04' (in other words: April 1), but "
-                f"found {datestr_m_d}"
-            )
-        return date_obj.month, date_obj.day
+    def _check_season_dates_are_ordered(self, df: pd.DataFrame) -> None:
+        """
+        Ensure that eind_winter < begin_zomer < eind_zomer < begin_winter for all rows. The dd-mm strings are
+        converted to day_of_year with constants.get_dd_mm_day_of_year(). Raise for the first row (in csv order) that
+        cannot be parsed or is not ordered.
+        """
+        season_cols = [self.col_eind_winter, self.col_begin_zomer, self.col_eind_zomer, self.col_begin_winter]
+        df_day_of_year = pd.DataFrame(
+            {col: df[col].map(constants.get_dd_mm_day_of_year()).astype(float) for col in season_cols}
+        )
+        mask_parse_error = df_day_of_year.isna().any(axis=1)
+        eind_winter, begin_zomer, eind_zomer, begin_winter = [df_day_of_year[col] for col in season_cols]
+        dates_are_ordered_ok = (eind_winter < begin_zomer) & (begin_zomer < eind_zomer) & (eind_zomer < begin_winter)
+        mask_error = mask_parse_error | ~dates_are_ordered_ok
+        if not mask_error.any():
+            return
+        position = mask_error.to_numpy().argmax()  # first row with an error
+        index = df.index[position]
+        if mask_parse_error.iloc[position]:
+            for col in season_cols:
+                try:
+                    constants.get_month_day_day_of_year(datestr_m_d=df[col].iloc[position])
+                except Exception as err:
+                    raise AssertionError(f"could not get dates from row {index}, err={err}")
+        raise AssertionError(f"dates are not ordered, row={index}")
+
+    def _add_row_csv_errors(self, df: pd.DataFrame, error_store: CsvErrorStore) -> None:
+        """
+        Check 0 and 2 to 5 (and check 1 if collect_all_errors) are the row rules: these are evaluated per row, so they
+        can be evaluated on any subset of rows.
+        """
+        self.rule_engine.evaluate(df=df, error_store=error_store, level=ValidationRule.level_row)
+
+    def _add_connect_csv_errors(
+        self, df: pd.DataFrame, error_store: CsvErrorStore, pgid_index: Optional[PgidBoundaryIndex] = None
+    ) -> None:
+        """
+        Check 6 (the 'pgid' rules) needs all rows of a pgid, so df must contain all rows of each pgid in df. The rows
+        are not sorted again if df is already sorted by (pgid, startdatum), and pgid_index (the index of df) is not
+        built again if it is given, see PgidBoundaryIndex.
+        """
+        self.rule_engine.evaluate(
+            df=df, error_store=error_store, level=ValidationRule.level_pgid, pgid_index=pgid_index
+        )
+
+    def _add_csv_errors_parallel(self, df: pd.DataFrame, error_store: CsvErrorStore) -> None:
+        """
+        Like _add_row_csv_errors and _add_connect_csv_errors, but the rows are hash partitioned by pgid (all rows of a
+        pgid are in the same partition) and each worker process evaluates the rules on one partition. The errors of
+        the partitions are merged in partition order. As the errors are stored per csv row (see CsvErrorStore), the
+        result does not depend on the nr of workers. Only the default rules are supported, as the worker processes
+        create their own ValidationRuleEngine (rules are not picklable).
+        """
+        default_rules = ValidationRuleEngine.get_default_rules(with_season_date_rules=self.collect_all_errors)
+        rule_names = [rule.name for rule in self.rule_engine.rules]
+        assert rule_names == [rule.name for rule in default_rules], "parallel validation only supports default rules"
+        partition_numbers = pd.util.hash_pandas_object(df[self.col_pgid], index=False).to_numpy() % self.workers
+        df_partitions = [df[partition_numbers == number] for number in range(self.workers)]
+        df_partitions = [df_partition for df_partition in df_partitions if not df_partition.empty]
+        logger.info(f"validate csv with {self.workers} workers ({len(df_partitions)} partitions of pgids)")
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            collect_all_errors = [self.collect_all_errors] * len(df_partitions)
+            for partition_error_store, seconds_per_rule in executor.map(
+                _get_partition_errors, df_partitions, collect_all_errors
+            ):
+                error_store.merge(other=partition_error_store)
+                for rule_name, seconds in seconds_per_rule.items():
+                    self.rule_engine.seconds_per_rule[rule_name] += seconds
 
-    def get_dummy_date(self, dummy_year: int, datestr_m_d: str) -> pd.Timestamp:
-        month, day = self.get_month_day_from_string(datestr_m_d)
-        date_obj = pd.Timestamp(year=dummy_year, month=month, day=day)
-        return date_obj
+    @staticmethod
+    def _write_csv_with_errors(
+        df: pd.DataFrame,
+        error_store: CsvErrorStore,
+        csv_file,
+        header: bool = True,
+        invalid_cells: Optional[pd.DataFrame] = None,
+    ) -> None:
+        """
+        Write df with an extra 'error' column to csv_file (path or open file). The error messages are rendered per
+        chunk of ERROR_CSV_CHUNK_SIZE rows, and df is not copied. Cells in invalid_cells are written with their original
+        text (see TypedCsvParser.with_invalid_cells).
+        """
+        chunk_size = constants.ERROR_CSV_CHUNK_SIZE
+        for start in range(0, max(len(df), 1), chunk_size):
+            end = start + chunk_size
+            df_chunk = df.iloc[start:end]
+            if invalid_cells is not None:
+                df_chunk = TypedCsvParser.with_invalid_cells(df=df_chunk, invalid_cells=invalid_cells)
+            df_chunk = df_chunk.assign(error=error_store.get_error_column(index=df_chunk.index))
+            df_chunk.to_csv(path_or_buf=csv_file, sep=",", index=False, header=header and start == 0)
 
     def validate_df(self) -> None:
         """
@@ -97,108 +209,52 @@ class ConvertCsvToXml(ColumnNameDtypeConstants):
         assert not self.df.empty
         logger.info(f"specific validating csv {self.orig_csv_path}")
 
-        # We already validated if columns exist and dtypes
-        error_list = []  # {<csv_row_index>:<error_message>}
-        for index, row in self.df.iterrows():
-            pgid = row[self.col_pgid]
-
-            # check 1: ensure that dates in 1 row are ordered (eind_winter < begin_zomer < eind_zomer < begin_winter)
-            try:
-                eind_winter = self.get_dummy_date(dummy_year=2000, datestr_m_d=row[self.col_eind_winter])
-                begin_zomer = self.get_dummy_date(dummy_year=2000, datestr_m_d=row[self.col_begin_zomer])
-                eind_zomer = self.get_dummy_date(dummy_year=2000, datestr_m_d=row[self.col_eind_zomer])
-                begin_winter = self.get_dummy_date(dummy_year=2000, datestr_m_d=row[self.col_begin_winter])
-            except Exception as err:
-                raise AssertionError(f"could not get dates from row {index}, err={err}")
-            dates_are_ordered_ok = eind_winter < begin_zomer < eind_zomer < begin_winter
-            if not dates_are_ordered_ok:
-                raise AssertionError(f"dates are not ordered, row={index}")
-
-            # check 2: validate onder marges per row
-
-            _min = constants.MIN_ALLOW_LOWER_MARGIN_CM
-            _max = constants.MAX_ALLOW_LOWER_MARGIN_CM
-            try:
-                boven_marges_are_ok = _min <= row[self.col_1e_marge_onder] <= row[self.col_2e_marge_onder] <= _max
-                if not boven_marges_are_ok:
-                    msg = f"invalid onder marges as we expected {_min} <= _1e_marge_onder <= _2e_marge_onder <= {_max}"
-                    error_list.append(CsvError(csv_row=index, pgid=pgid, error_msg=msg))
-            except KeyError:
-                error_list.append(CsvError(csv_row=index, pgid=pgid, error_msg="onder marges could not be checked"))
-
-            # check 3: validate boven marges per row
-            _min = constants.MIN_ALLOW_UPPER_MARGIN_CM
-            _max = constants.MAX_ALLOW_UPPER_MARGIN_CM
-            try:
-                boven_marges_are_ok = _min <= row[self.col_1e_marge_boven] <= row[self.col_2e_marge_boven] <= _max
-                if not boven_marges_are_ok:
-                    msg = f"invalid boven marges as we expected {_min} <= _1e_marge_boven <= _2e_marge_boven <= {_max}"
-                    error_list.append(CsvError(csv_row=index, pgid=pgid, error_msg=msg))
-            except KeyError:
-                error_list.append(CsvError(csv_row=index, pgid=pgid, error_msg="boven marges could not be checked"))
-
-            # check 4: check peilen
-            _min = constants.MIN_ALLOWED_MNAP
-            _max = constants.MAX_ALLOWED_MNAP
-            zomerpeil_ok = _min <= row[self.col_zomerpeil] <= _max
-            if not zomerpeil_ok:
-                msg = f"invalid zomerpeil as we expected {_min} <= zomerpeil <= {_max}"
-                error_list.append(CsvError(csv_row=index, pgid=pgid, error_msg=msg))
-            winterpeil_ok = _min <= row[self.col_winterpeil] <= _max
-            if not winterpeil_ok:
-                msg = f"invalid winterpeil as we expected {_min} <= winterpeil <= {_max}"
-                error_list.append(CsvError(csv_row=index, pgid=pgid, error_msg=msg))
-
-        # check 5: col_startdatum < col_einddatum
-        mask_error = self.df[self.col_startdatum] >= self.df[self.col_einddatum]
-        for index, row in self.df[mask_error].iterrows():
-            pgid = row[self.col_pgid]
-            error_list.append(CsvError(csv_row=index, pgid=pgid, error_msg="start < einddatum"))
-
-        # check 6: subsequent rows of the same pgid must connect (no gap, and no overlap)
-        default_msg = "subsequent rows of the same pgid must connect (no gap, and no overlap)"
-        for pgid, df_pgid in self.df.groupby(by=self.col_pgid):
-            df_sorted_by_start = df_pgid.sort_values(by=self.col_startdatum)
-            previous_end = None
-            for row_index, row in df_sorted_by_start.iterrows():
-                if not previous_end:
-                    previous_end = row[self.col_einddatum]
-                    continue
-                current_start = row[self.col_startdatum]
-                current_start_is_ok = current_start == previous_end
-                if not current_start_is_ok:
-                    msg = (
-                        f"{default_msg}: {self.col_pgid}={pgid}, row={row_index}, {self.col_startdatum}="
-                        f"{current_start}, previous_end={previous_end}"
-                    )
-                    error_list.append(CsvError(csv_row=row_index, pgid=pgid, error_msg=msg))
-                previous_end = row[self.col_einddatum]
+        # We already validated if columns exist and dtypes. All checks below are evaluated per column (not per row)
+
+        # check 1: ensure that dates in 1 row are ordered (eind_winter < begin_zomer < eind_zomer < begin_winter)
+        if not self.collect_all_errors:
+            self._check_season_dates_are_ordered(df=self.df)
+
+        # check 0 and 2 to 5 (and check 1 if collect_all_errors): per row. Check 6: per pgid. We sort once by
+        # (pgid, startdatum) and build the pgid index once: check 6 and the xml use this order and index
+        error_store = CsvErrorStore()
+        pgid_index = PgidBoundaryIndex(df=self.df)
+        df_sorted = pgid_index.df
+        if self.workers > 1:
+            self._add_csv_errors_parallel(df=df_sorted, error_store=error_store)
+        else:
+            self._add_row_csv_errors(df=self.df, error_store=error_store)
+            self._add_connect_csv_errors(df=df_sorted, error_store=error_store, pgid_index=pgid_index)
 
         # create feedback csv
-        error_dict = {}
-        for error in error_list:
-            existing_error = error_dict.get(error.csv_row, "")
-            error_dict[error.csv_row] = f"{existing_error} | {error.error_msg}" if existing_error else error.error_msg
-        df_error = self.df.copy()
-        df_error["error"] = pd.Series(error_dict)
         df_error_path = self.output_dir / "orig_with_errors.csv"
         logger.info(f"creating {df_error_path}")
-        df_error.to_csv(path_or_buf=df_error_path, sep=",", index=False)
+        with open(df_error_path.as_posix(), mode="w", encoding="utf-8", newline="") as df_error_file:
+            self._write_csv_with_errors(
+                df=self.df, error_store=error_store, csv_file=df_error_file, invalid_cells=self._invalid_cells
+            )
 
         # remove all pgids that have 1 or more errors
-        index_errors = sorted(set([x.pgid for x in error_list]))
-        mask_pgid_error = self._df[self.col_pgid].isin(index_errors)
-        nr_pgid_with_error = len(index_errors)
-        nr_rows_with_error = sum(mask_pgid_error)
+        pgids_with_error = error_store.get_error_pgids(df=self.df)
+        mask_pgid_error = pd.Series(pgid_index.pgids).isin(pgids_with_error).to_numpy()
+        nr_pgid_with_error = len(pgids_with_error)
+        nr_rows_with_error = (pgid_index.stops - pgid_index.starts)[mask_pgid_error].sum()
         if nr_pgid_with_error or nr_rows_with_error:
             logger.warning(f"found {nr_pgid_with_error} pgid with an error, and {nr_rows_with_error} with an error")
             logger.warning(f"deleting {nr_rows_with_error} rows")
         else:
             logger.info("no errors found! :)")
-        self._df = self._df[~mask_pgid_error]
+        self.rule_engine.log_timings()
+        # df stays sorted by (pgid, startdatum), as we remove all rows of a pgid
+        self._pgid_index = pgid_index.select(mask_pgid=~mask_pgid_error)
+        self._df = self._pgid_index.df
 
-        # ensure df is sorted
-        self._df = self._df.sort_values([self.col_pgid, self.col_startdatum], ascending=[True, True])
+    @property
+    def pgid_index(self) -> PgidBoundaryIndex:
+        """The index of self.df (built in validate_df, or now if self.df was not validated)."""
+        if self._pgid_index is None or self._pgid_index.df is not self.df:
+            self._pgid_index = PgidBoundaryIndex(df=self.df)
+        return self._pgid_index
 
     @staticmethod
     def _add_xml_first_rows(xml_file):
@@ -214,24 +270,38 @@ class ConvertCsvToXml(ColumnNameDtypeConstants):
         xml_file.write("</TimeSeries>\n")
         return xml_file
 
-    @staticmethod
-    def _add_xml_series(xml_file, df_pgid: pd.DataFrame, _func):
-        """Add one xml series build from one or more csv rows"""
-        xml_builder = None
-        first_index = min(df_pgid.index)
-        last_index = max(df_pgid.index)
-        for index, row in df_pgid.iterrows():
-            is_first_pgid_csv_row = index == first_index
-            is_last_pgid_csv_row = index == last_index
-            xml_builder = XmlSeriesBuilder(
-                xml_file=xml_file,
-                is_first_pgid_csv_row=is_first_pgid_csv_row,
-                is_last_pgid_csv_row=is_last_pgid_csv_row,
-                df_pgid_row=row,
-            )
-            xml_builder_method = getattr(xml_builder, _func.__name__)
-            xml_file = xml_builder_method()
-        return xml_builder.xml_file
+    @classmethod
+    def iter_xml_fragments(cls, pgid_index: PgidBoundaryIndex) -> Iterator[str]:
+        """Yield per pgid (sorted by pgid) one xml fragment with its 5 series, build from its csv row(s)."""
+        # the events are computed at once for a chunk of pgids (so memory is bounded by the chunk size, not by the
+        # size of the export), the xml is rendered per pgid. The header values are taken from the pgid index, so no
+        # df slice per pgid is needed
+        for pgid_index_chunk in pgid_index.iter_row_chunks(chunk_size=constants.XML_EVENT_TABLE_CHUNK_SIZE):
+            event_table_builder = EventTableBuilder(pgid_index=pgid_index_chunk)
+            pgid_series = zip(pgid_index_chunk.iter_pgid_headers(), event_table_builder.iter_pgid_series())
+            for (pgid, startdatum, einddatum), (_pgid, all_series_events) in pgid_series:
+                assert pgid == _pgid, f"code error: pgid {pgid} != {_pgid}"
+                xml_builder = XmlSeriesBuilder(xml_file=None, pgid=pgid, startdatum=startdatum, einddatum=einddatum)
+                yield xml_builder.get_all_series_xml(all_series_events=all_series_events)
+
+    def _iter_xml_fragments_parallel(self) -> Iterator[str]:
+        """
+        Like iter_xml_fragments, but each worker process renders the fragments of a chunk of pgids. The chunks
+        are returned in pgid order, so the fragments are in the same order as in iter_xml_fragments.
+        """
+        pgid_index_chunks = self.pgid_index.split(nr_chunks=self.workers * constants.XML_CHUNKS_PER_WORKER)
+        logger.info(f"render xml with {self.workers} workers ({len(pgid_index_chunks)} chunks of pgids)")
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for xml_fragments in executor.map(_get_xml_fragments, pgid_index_chunks):
+                yield from xml_fragments
+
+    def _get_nr_xml_pgids(self) -> int:
+        return self.df[self.col_pgid].nunique()
+
+    def _iter_all_xml_fragments(self) -> Iterator[str]:
+        if self.workers > 1 and not self.df.empty:
+            return self._iter_xml_fragments_parallel()
+        return self.iter_xml_fragments(pgid_index=self.pgid_index)
 
     def _create_xml(
         self, xml_path: Path, create_small_xml: bool = False, create_large_xml: bool = True
@@ -241,56 +311,46 @@ class ConvertCsvToXml(ColumnNameDtypeConstants):
 
         assert xml_path.suffix == ".xml"
 
-        xml_large_file = None
-        xml_large_file_path = None
-        if create_large_xml:
-            xml_large_file_path = xml_path
-            xml_large_file = open(xml_large_file_path.as_posix(), mode="w")
-            xml_large_file = self._add_xml_first_rows(xml_file=xml_large_file)
-
-        xml_small_file = None
+        # each xml fragment is rendered once and written to both xml files. Each xml is written to a temporary path
+        # that is renamed on success, so an error never leaves a half written xml (and all files are closed)
+        xml_tee = XmlFragmentTee()
+        nr_to_do = self._get_nr_xml_pgids()
         xml_small_file_path = None
-        if create_small_xml:
-            xml_small_file_path = xml_path.parent / f"{xml_path.stem}_test_sample{xml_path.suffix}"
-            logger.info("creating also a small test sample (.xml)")
-            xml_small_file = open(xml_small_file_path.as_posix(), mode="w")
-            xml_small_file = self._add_xml_first_rows(xml_file=xml_small_file)
-
-        df_grouped_by_pgid = self.df.groupby(by=self.col_pgid)
-        nr_to_do = len(df_grouped_by_pgid)
-        xml_small_file_max_index = int(nr_to_do / 50)  # use ~2% of all data
-
-        progress = 0
-        for index, (pgid, df_pgid) in enumerate(df_grouped_by_pgid):
-            new_progress = get_progress(iteration_nr=index, nr_to_do=nr_to_do)
-            if new_progress != progress:
-                logger.info(f"build .xml progress = {get_progress(iteration_nr=index, nr_to_do=nr_to_do)}%")
-                progress = new_progress
-            for _func in (
-                XmlSeriesBuilder.add_series_peilbesluitpeil,
-                XmlSeriesBuilder.add_series_eerste_ondergrens,
-                XmlSeriesBuilder.add_series_tweede_ondergrens,
-                XmlSeriesBuilder.add_series_eerste_bovengrens,
-                XmlSeriesBuilder.add_series_tweede_bovengrens,
-            ):
-                if create_small_xml and index < xml_small_file_max_index:
-                    xml_small_file = self._add_xml_series(xml_file=xml_small_file, df_pgid=df_pgid, _func=_func)
-                if create_large_xml:
-                    xml_large_file = self._add_xml_series(xml_file=xml_large_file, df_pgid=df_pgid, _func=_func)
-
-        if create_small_xml:
-            xml_small_file = self._add_xml_last_rows(xml_file=xml_small_file)
-            xml_small_file.close()
-        if create_large_xml:
-            xml_large_file = self._add_xml_last_rows(xml_file=xml_large_file)
-            xml_large_file.close()
+        xml_large_file_path = None
+        with ExitStack() as stack:
+            if create_large_xml:
+                xml_large_file_path = xml_path
+                tmp_path = stack.enter_context(atomic_write(path=xml_large_file_path))
+                xml_tee.add_sink(xml_file=stack.enter_context(XmlFileWriter(path=tmp_path)))
+            if create_small_xml:
+                xml_small_file_path = xml_path.parent / f"{xml_path.stem}_test_sample{xml_path.suffix}"
+                logger.info("creating also a small test sample (.xml)")
+                xml_small_file_max_nr = int(nr_to_do / 50)  # use ~2% of all data
+                tmp_path = stack.enter_context(atomic_write(path=xml_small_file_path))
+                xml_tee.add_sink(
+                    xml_file=stack.enter_context(XmlFileWriter(path=tmp_path)), max_nr_fragments=xml_small_file_max_nr
+                )
+
+            xml_tee = self._add_xml_first_rows(xml_file=xml_tee)
+            progress = 0
+            for index, xml_fragment in enumerate(self._iter_all_xml_fragments()):
+                new_progress = get_progress(iteration_nr=index, nr_to_do=nr_to_do)
+                if new_progress != progress:
+                    logger.info(f"build .xml progress = {get_progress(iteration_nr=index, nr_to_do=nr_to_do)}%")
+                    progress = new_progress
+                xml_tee.write_fragment(fragment=xml_fragment)
+                if not xml_tee.accepts_fragments:
+                    break  # e.g. only the small xml is created
+            xml_tee = self._add_xml_last_rows(xml_file=xml_tee)
 
         return xml_small_file_path, xml_large_file_path
 
     def run(self):
         csv_orig = self.output_dir / "orig.csv"
         logger.info(f"creating {csv_orig}")
-        self.df.to_csv(path_or_buf=csv_orig, sep=",", index=False)
+        TypedCsvParser.with_invalid_cells(df=self.df, invalid_cells=self._invalid_cells).to_csv(
+            path_or_buf=csv_orig, sep=",", index=False
+        )
 
         # create csv that was used as input for xml
         self.validate_df()
@@ -305,3 +365,7 @@ class ConvertCsvToXml(ColumnNameDtypeConstants):
         xml_path = self.output_dir / "PeilbesluitPi.xml"
         logger.info(f"creating {xml_path}")
         xml_small_file_path, xml_large_file_path = self._create_xml(xml_path=xml_path, create_small_xml=True)  # noqa
+        if self.workers > 1:
+            return  # the caches are in the worker processes
+        for cache_name, cache_info in XmlSeriesBuilder.get_cache_info().items():
+            logger.info(f"xml {cache_name} cache: {cache_info}")
@@ -0,0 +1,93 @@
+from converter import constants
+from converter.csv_parser import TypedCsvParser
+from converter.utils import atomic_write
+from converter.utils import get_file_hash
+from pathlib import Path
+from typing import Optional
+
+import hashlib
+import logging
+import os
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+class ParsedCsvCache:
+    """
+    Local cache of the parsed (typed) export, so that a re-run on the same csv (e.g. on a slow network drive) loads
+    the df instead of reading and parsing the csv again:
+        - the key is the sha256 of the csv content, its size and its modification time, plus the dtype map and the
+          pandas version (a cached df is only valid for the parser and pandas that created it)
+        - the df is stored in the Arrow IPC (feather) columnar format if pyarrow is installed, else as a pickle
+        - the cache is limited to max_size_bytes: the least recently used entries are removed (a hit touches its file)
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = constants.CSV_CACHE_DIR,
+        max_size_bytes: int = constants.CSV_CACHE_MAX_SIZE_BYTES,
+    ):
+        assert max_size_bytes > 0, f"max_size_bytes must be > 0, but found {max_size_bytes}"
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.suffix = ".feather" if TypedCsvParser.is_pyarrow_installed() else ".pickle"
+
+    def get_cache_path(self, csv_path: Path) -> Path:
+        assert csv_path.is_file(), f"csv {csv_path} does not exist"
+        stat = csv_path.stat()
+        parser_hash = hashlib.sha256(f"{TypedCsvParser.dtypes}{pd.__version__}".encode()).hexdigest()[:8]
+        key = f"{get_file_hash(path=csv_path)}_{stat.st_size}_{stat.st_mtime_ns}_{parser_hash}"
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def load(self, cache_path: Path) -> Optional[pd.DataFrame]:
+        if not cache_path.is_file():
+            return None
+        try:
+            df = pd.read_feather(cache_path) if self.suffix == ".feather" else pd.read_pickle(cache_path)
+        except Exception as err:  # noqa a corrupt entry (e.g. an interrupted write) is a cache miss
+            logger.warning(f"could not load cache {cache_path}, removing it, err={err}")
+            cache_path.unlink()
+            return None
+        os.utime(cache_path.as_posix())  # mark as recently used
+        logger.info(f"loaded parsed csv from cache {cache_path}")
+        return df
+
+    def save(self, df: pd.DataFrame, cache_path: Path) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with atomic_write(path=cache_path) as tmp_path:
+            if self.suffix == ".feather":
+                df.to_feather(tmp_path)
+            else:
+                df.to_pickle(tmp_path)
+        logger.info(f"saved parsed csv to cache {cache_path}")
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache is <= max_size_bytes."""
+        entries = [(x.stat().st_mtime_ns, x.stat().st_size, x) for x in self.cache_dir.glob(f"*{self.suffix}")]
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            logger.info(f"removing least recently used cache {path}")
+            path.unlink()
+            total_size -= size
+
+    def read(self, parser: TypedCsvParser) -> pd.DataFrame:
+        """
+        The parsed csv of parser: loaded from the cache, or read with parser.read() and then saved in the cache. A csv
+        with invalid cells (see TypedCsvParser.get_invalid_cells) is not cached, so a cached csv has none.
+        """
+        cache_path = self.get_cache_path(csv_path=parser.path)
+        df = self.load(cache_path=cache_path)
+        if df is not None:
+            parser.invalid_cells = pd.DataFrame()
+            return df
+        df = parser.read()
+        if parser.invalid_cells.empty:
+            self.save(df=df, cache_path=cache_path)
+        else:
+            logger.info(f"not caching csv {parser.path}, since it has cells that can not be converted")
+        return df
@@ -0,0 +1,310 @@
+from converter import constants
+from converter.constants import ColumnNameDtypeConstants
+from pathlib import Path
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+import importlib.util
+import io
+import itertools
+import locale
+import logging
+import numpy as np
+import pandas as pd
+import warnings
+
+
+logger = logging.getLogger(__name__)
+
+
+class TypedCsvParser(ColumnNameDtypeConstants):
+    """
+    Read the GIS export and apply the dtype map (ColumnNameDtypeConstants.dtypes) while parsing, instead of letting
+    pandas guess the dtypes and converting them afterwards:
+        - all cells are read as text, so that nothing is guessed
+        - pgid stays text, season columns become a category, yyyymmdd dates become datetime64, peilen become floats
+          and marges become (nullable) ints
+        - a cell that is empty or can not be converted (e.g. a marge that is not an integer) becomes NaN/NaT/NA, so the
+          rest of its column is typed anyway. The validation reports these cells as row errors (see
+          ConvertCsvToXml._add_row_csv_errors). The original text of these cells is kept (see get_invalid_cells), so
+          that orig.csv and orig_with_errors.csv show what was wrong
+    With engine='pyarrow' (optional dependency) read() uses the multi-threaded csv reader of pyarrow, see _read_arrow.
+    """
+
+    separators = (",", ";")
+    encoding = "utf-8-sig"  # utf-8 with or without byte order mark
+    date_format = constants.DateFormats.yyyymmdd.value
+    engines = ("pandas", "pyarrow")
+
+    def __init__(self, path: Path, engine: str = "pandas"):
+        assert engine in self.engines, f"engine must be one of {self.engines}, but found {engine}"
+        assert engine != "pyarrow" or self.is_pyarrow_installed(), "engine 'pyarrow' requires 'pip install pyarrow'"
+        self.path = path
+        self.engine = engine
+        self._separator = None
+        self._encoding = self.encoding
+        self.invalid_cells = None
+
+    @staticmethod
+    def is_pyarrow_installed() -> bool:
+        return importlib.util.find_spec("pyarrow") is not None
+
+    def _read_header(self) -> str:
+        try:
+            with open(self.path.as_posix(), encoding=self._encoding) as csv_file:
+                return csv_file.readline().rstrip("\r\n")
+        except UnicodeDecodeError as err:
+            if self._encoding != self.encoding:
+                raise
+            # like PdReadFlexibleCsv: fall back to the platform's default encoding (e.g. cp1252 on Windows)
+            self._encoding = locale.getpreferredencoding(False)
+            logger.warning(f"csv {self.path} is not {self.encoding}, using encoding {self._encoding}, err={err}")
+            return self._read_header()
+
+    @property
+    def separator(self) -> str:
+        """The separator (',' or ';') of the header that contains all expected columns."""
+        if self._separator is not None:
+            return self._separator
+        assert self.path.is_file(), f"csv {self.path} does not exist"
+        header = self._read_header()
+        missing_cols_per_separator = {}
+        for separator in self.separators:
+            columns = [x.strip() for x in header.split(separator)]
+            missing_cols = [col for col in self.all_cols if col not in columns]
+            if not missing_cols:
+                self._separator = separator
+                return self._separator
+            missing_cols_per_separator[separator] = missing_cols
+        raise AssertionError(
+            f"could not read csv {self.path} with separators {self.separators}, expected columns={self.all_cols}, "
+            f"missing columns per separator={missing_cols_per_separator}"
+        )
+
+    def _read_csv_text(self, path_or_buf) -> pd.DataFrame:
+        """
+        Read a csv with text cells. With index_col=False pandas does not silently use the first column as index if
+        the first data row has too many fields, but drops these fields with a ParserWarning: we raise that warning.
+        Other rows with too many fields raise a ParserError. We do not use read_csv(usecols=..) since then rows with
+        too many fields are not detected at all.
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", category=pd.errors.ParserWarning)
+            df = pd.read_csv(path_or_buf, sep=self.separator, dtype=str, index_col=False, encoding=self._encoding)
+        return df.rename(columns=str.strip)
+
+    def _iter_read_csv(self, chunk_size: Optional[int]) -> Iterator[pd.DataFrame]:
+        """
+        Yield the csv (text cells) in chunks of chunk_size rows, or in one chunk if chunk_size is None. Each chunk is
+        read as a csv of its own (header + chunk_size lines) instead of with read_csv(chunksize=..), since then a row
+        with too many fields at the start of a chunk is silently truncated. The index is the csv row.
+        """
+        first_row = 0
+        try:
+            if chunk_size is None:
+                yield self._read_csv_text(path_or_buf=self.path.as_posix())
+                return
+            with open(self.path.as_posix(), encoding=self._encoding) as csv_file:
+                header = csv_file.readline()
+                for lines in iter(lambda: list(itertools.islice(csv_file, chunk_size)), []):
+                    df = self._read_csv_text(path_or_buf=io.StringIO("".join([header] + lines)))
+                    df.index += first_row
+                    first_row += len(df)
+                    if not df.empty:
+                        yield df
+        except (pd.errors.ParserError, pd.errors.ParserWarning) as err:
+            raise AssertionError(
+                f"csv error in {self.path} (separator '{self.separator}', chunk from csv row {first_row}), err={err}"
+            )
+
+    def _read_arrow(self) -> Optional[pd.DataFrame]:
+        """
+        Read the csv with pyarrow's multi-threaded csv reader, which converts the cells to the dtype map while reading
+        (so no text columns in between): dates with date_format, peilen and marges to float64 (marges are then cast
+        to int). The text columns are stripped in arrow, so the only pandas steps are the category and int conversion.
+        Return None if pyarrow can not read the csv, e.g. a cell can not be converted (also a marge that is not an
+        integer) or a row (also the first data row) has a different nr of fields than the header. Then read() falls
+        back to the pandas parser, that handles such cells and raises for such rows (and has the same result for all
+        other csvs).
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.csv as pa_csv
+
+        separator = self.separator
+        arrow_types = {"datetime64": pa.timestamp("us"), "Int64": pa.float64(), float: pa.float64()}
+        column_types = {col: arrow_types.get(dtype, pa.string()) for col, dtype in self.dtypes.items()}
+        try:
+            table = pa_csv.read_csv(
+                self.path.as_posix(),
+                read_options=pa_csv.ReadOptions(
+                    column_names=[x.strip() for x in self._read_header().split(separator)],
+                    skip_rows=1,
+                    # pyarrow skips a utf-8 byte order mark itself, other encodings are transcoded (slower)
+                    encoding="utf8" if self._encoding == self.encoding else self._encoding,
+                ),
+                parse_options=pa_csv.ParseOptions(delimiter=separator),
+                convert_options=pa_csv.ConvertOptions(
+                    column_types=column_types,
+                    include_columns=self.all_cols,
+                    timestamp_parsers=[self.date_format],
+                    strings_can_be_null=True,
+                ),
+            )
+        except pa.ArrowInvalid as err:
+            logger.info(f"pyarrow can not read csv {self.path}, using pandas instead, err={err}")
+            return None
+        columns = {}
+        for col, dtype in self.dtypes.items():
+            column = table[col]
+            columns[col] = pc.utf8_trim_whitespace(column) if dtype in (str, "category") else column
+        df = pa.table(columns).to_pandas()
+        for col, dtype in self.dtypes.items():
+            if dtype == "category":
+                df[col] = df[col].astype("category")
+            elif dtype == "Int64":
+                values = df[col].to_numpy()
+                is_value = ~np.isnan(values)
+                if (values[is_value] != np.round(values[is_value])).any():
+                    logger.info(f"pyarrow found a value in {col} that is not an integer, using pandas instead")
+                    return None
+                df[col] = df[col].astype("Int64")
+        return df
+
+    def read(self) -> pd.DataFrame:
+        """The parsed csv. The original text of the cells that could not be converted is in self.invalid_cells."""
+        df = self._read_arrow() if self.engine == "pyarrow" else None
+        if df is not None:
+            self.invalid_cells = pd.DataFrame()  # else pyarrow could not have read the csv
+            return df
+        df_text = next(self._iter_read_csv(chunk_size=None))
+        df = self.parse(df=df_text)
+        self.invalid_cells = self.get_invalid_cells(df_text=df_text, df=df)
+        return df
+
+    def iter_chunks(self, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """Yield the parsed csv in chunks of chunk_size rows (index is the csv row, like in read())."""
+        assert chunk_size > 0
+        for df_chunk in self._iter_read_csv(chunk_size=chunk_size):
+            yield self.parse(df=df_chunk)
+
+    def iter_chunks_with_invalid_cells(self, chunk_size: int) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+        """Like iter_chunks, but yield per chunk also the original text of its invalid cells (see get_invalid_cells)."""
+        assert chunk_size > 0
+        for df_text in self._iter_read_csv(chunk_size=chunk_size):
+            df_chunk = self.parse(df=df_text)
+            yield df_chunk, self.get_invalid_cells(df_text=df_text, df=df_chunk)
+
+    @staticmethod
+    def _to_int(values: pd.Series) -> pd.Series:
+        """Nullable int: a value that is NaN, infinite or not an integer becomes NA (it is not truncated)."""
+        values = pd.to_numeric(values, errors="coerce").astype(float)
+        return values.where(np.isfinite(values) & (values == np.round(values))).astype("Int64")
+
+    def parse(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Convert a df with text cells (read with dtype=str) to the dtype map."""
+        df = df[self.all_cols]
+        for col, dtype in self.dtypes.items():
+            if dtype == str:
+                df[col] = df[col].str.strip()
+            elif dtype == "category":
+                df[col] = df[col].str.strip().astype("category")
+            elif dtype == "datetime64":
+                df[col] = pd.to_datetime(df[col].str.strip(), format=self.date_format, exact=True, errors="coerce")
+            elif dtype == "Int64":
+                df[col] = self._to_int(values=df[col])
+            elif dtype == float:
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype(float)
+            else:
+                raise AssertionError(f"code error: unexpected dtype {dtype} for col {col}")
+        return df
+
+    @classmethod
+    def get_dtype_description(cls, col: str) -> str:
+        dtype = cls.dtypes[col]
+        if dtype == "datetime64":
+            return "a yyyymmdd date"
+        if dtype == "Int64":
+            return "an integer"
+        if dtype == float:
+            return "a number"
+        return "text"
+
+    @classmethod
+    def get_invalid_cells(cls, df_text: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        The original text of the cells that are not empty, but could not be converted to the dtype map (so they are
+        NaN/NaT/NA in df, the parsed df_text). Index is the csv row (only rows with >=1 such cell), with a column per
+        csv column with >=1 such cell (NaN for the other cells).
+        """
+        invalid_cells = {}
+        for col, dtype in cls.dtypes.items():
+            if dtype in (str, "category"):
+                continue
+            texts = df_text[col]
+            mask_invalid = df[col].isna() & (texts.str.strip().fillna("") != "")
+            if mask_invalid.any():
+                invalid_cells[col] = texts[mask_invalid]
+        return pd.DataFrame(invalid_cells)
+
+    @classmethod
+    def with_invalid_cells(cls, df: pd.DataFrame, invalid_cells: pd.DataFrame) -> pd.DataFrame:
+        """
+        df (e.g. a chunk of the parsed csv) with the original text of its invalid cells (see get_invalid_cells), to
+        write it to csv. The columns with such cells are text (dates in the yyyy-mm-dd format of DataFrame.to_csv),
+        the other columns are not changed. df is only copied if it has invalid cells.
+        """
+        rows = invalid_cells.index.intersection(df.index)
+        if rows.empty:
+            return df
+        df = df.copy()
+        for col in invalid_cells.columns:
+            texts = invalid_cells.loc[rows, col].dropna()
+            if texts.empty:
+                continue
+            if cls.dtypes[col] == "datetime64":
+                values = df[col].dt.strftime(constants.DateFormats.yyyy_mm_dd.value).astype(object)
+            else:
+                values = df[col].astype(object)
+            values.loc[texts.index] = texts
+            df[col] = values
+        return df
+
+    @classmethod
+    def _is_lossless_float32(cls, values: np.ndarray) -> bool:
+        """True if all values have <= compact_nr_decimals decimals, so get_float64 restores them exactly."""
+        values = values[~np.isnan(values)]
+        values_float32 = values.astype(np.float32)
+        return bool(
+            (np.round(values, cls.compact_nr_decimals) == values).all()
+            and (np.round(values_float32.astype(np.float64), cls.compact_nr_decimals) == values).all()
+        )
+
+    @classmethod
+    def to_compact(cls, df: pd.DataFrame) -> pd.DataFrame:
+        """Convert df (parsed with the dtype map) to the compact_dtypes, for each column where that is lossless."""
+        int16_info = np.iinfo(np.int16)
+        for col, compact_dtype in cls.compact_dtypes.items():
+            values = df[col]
+            if compact_dtype == "category":
+                df[col] = values.astype("category")
+            elif pd.api.types.is_integer_dtype(values):
+                values_not_na = values.dropna()
+                if values_not_na.empty or (
+                    int16_info.min <= values_not_na.min() and values_not_na.max() <= int16_info.max
+                ):
+                    df[col] = values.astype(compact_dtype)
+            elif cls._is_lossless_float32(values=values.to_numpy(dtype=np.float64)):
+                df[col] = values.astype(np.float32)
+        return df
+
+    @classmethod
+    def get_float64(cls, values: pd.Series) -> np.ndarray:
+        """
+        The float64 values of a numeric column (NA becomes NaN). Compact float32 values are rounded back to their
+        decimals.
+        """
+        if values.dtype == np.float32:
+            return np.round(values.to_numpy(dtype=np.float64), cls.compact_nr_decimals)
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
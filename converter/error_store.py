@@ -0,0 +1,118 @@
+from converter.constants import ColumnNameDtypeConstants
+from typing import Dict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+class CsvErrorStore(ColumnNameDtypeConstants):
+    """
+    Columnar store of the validation errors: per rule one boolean mask over all csv rows (position = csv row, so the
+    index of ConvertCsvToXml.df), instead of one python object and one string concatenation per error:
+        - memory is flat: nr_rules bytes per csv row, no matter how many rows fail
+        - a rule with a row specific message (e.g. check 6) stores its details in arrays over all csv rows as well
+        - the messages are only rendered (get_error_column) when orig_with_errors.csv is written, per chunk of rows.
+          The messages of a row are in the order the rules were added, joined with ' | '
+    """
+
+    separator = " | "
+
+    def __init__(self):
+        self._nr_rows = 0
+        self._masks: Dict[str, np.ndarray] = {}
+        self._messages: Dict[str, str] = {}
+        self._details: Dict[str, Dict[str, np.ndarray]] = {}
+
+    def _grow(self, nr_rows: int) -> None:
+        """Ensure that all arrays have >= nr_rows rows (in streaming mode we do not know the nr of csv rows upfront)."""
+        if nr_rows <= self._nr_rows:
+            return
+        new_nr_rows = max(nr_rows, 2 * self._nr_rows)
+        for rule, mask in self._masks.items():
+            self._masks[rule] = np.concatenate([mask, np.zeros(new_nr_rows - self._nr_rows, dtype=bool)])
+        for rule_details in self._details.values():
+            for name, values in rule_details.items():
+                rule_details[name] = np.concatenate([values, np.empty(new_nr_rows - self._nr_rows, values.dtype)])
+        self._nr_rows = new_nr_rows
+
+    def add(self, rule: str, mask_error: pd.Series, message: str, details: Dict[str, pd.Series] = None) -> None:
+        """
+        Add the errors of rule: the rows (index = csv row) in mask_error that are True. Without details the message is
+        the same for all rows. With details the message is a template, rendered per row with message.format(row=<csv
+        row>, **<details of that row>). Each rule must always have the same message.
+        """
+        if rule not in self._masks:
+            self._masks[rule] = np.zeros(self._nr_rows, dtype=bool)
+            self._messages[rule] = message
+        assert self._messages[rule] == message, f"code error: rule {rule} has >1 messages"
+        is_error = mask_error.to_numpy(dtype=bool)
+        rows = mask_error.index.to_numpy()[is_error]
+        if not len(rows):
+            return
+        self._grow(nr_rows=rows.max() + 1)
+        self._masks[rule][rows] = True
+        for name, values in (details or {}).items():
+            rule_details = self._details.setdefault(rule, {})
+            values = values.to_numpy()
+            if name not in rule_details:
+                rule_details[name] = np.empty(self._nr_rows, dtype=values.dtype)
+            rule_details[name][rows] = values[is_error]
+
+    def merge(self, other: "CsvErrorStore") -> None:
+        """Add the errors of other, e.g. of a partition of the csv rows that was validated in a worker process."""
+        for rule, mask in other._masks.items():
+            rows = np.flatnonzero(mask)
+            details = {
+                name: pd.Series(values[rows], index=rows) for name, values in other._details.get(rule, {}).items()
+            }
+            mask_error = pd.Series(np.ones(len(rows), dtype=bool), index=rows)
+            self.add(rule=rule, mask_error=mask_error, message=other._messages[rule], details=details)
+
+    def _get_rows_mask(self, rule: str, rows: np.ndarray) -> np.ndarray:
+        """Per row in rows (csv rows) True if it has an error of rule."""
+        is_stored = rows < self._nr_rows
+        mask = np.zeros(len(rows), dtype=bool)
+        mask[is_stored] = self._masks[rule][rows[is_stored]]
+        return mask
+
+    def get_error_mask(self, index: pd.Index) -> np.ndarray:
+        """Per csv row in index True if it has >=1 error."""
+        rows = index.to_numpy()
+        mask = np.zeros(len(rows), dtype=bool)
+        for rule in self._masks:
+            mask |= self._get_rows_mask(rule=rule, rows=rows)
+        return mask
+
+    def get_error_pgids(self, df: pd.DataFrame) -> np.ndarray:
+        """Pgid-level rollup: the unique pgids (can include NaN) of the rows in df that have >=1 error."""
+        return df[self.col_pgid][self.get_error_mask(index=df.index)].unique()
+
+    @staticmethod
+    def _check_message(message: str) -> str:
+        assert "," not in message, "code error. avoid ',' in value (difficult in excel)"
+        return message
+
+    def _render_messages(self, rule: str, rows: np.ndarray) -> Optional[np.ndarray]:
+        mask = self._get_rows_mask(rule=rule, rows=rows)
+        if not mask.any():
+            return None
+        messages = np.full(len(rows), None, dtype=object)
+        if rule not in self._details:
+            messages[mask] = self._check_message(message=self._messages[rule])
+            return messages
+        error_rows = rows[mask]
+        details = {name: pd.Series(values[error_rows]) for name, values in self._details[rule].items()}
+        messages[mask] = [
+            self._check_message(message=self._messages[rule].format(row=row, **row_details))
+            for row, row_details in zip(error_rows, pd.DataFrame(details).to_dict(orient="records"))
+        ]
+        return messages
+
+    def get_error_column(self, index: pd.Index) -> pd.Series:
+        """The error messages of each csv row in index (None if no error), rendered now."""
+        rows = index.to_numpy()
+        rule_messages = [self._render_messages(rule=rule, rows=rows) for rule in self._masks]
+        rule_messages = [messages for messages in rule_messages if messages is not None]
+        errors = [self.separator.join(filter(None, row_messages)) or None for row_messages in zip(*rule_messages)]
+        return pd.Series(errors if rule_messages else None, index=index, dtype=object)
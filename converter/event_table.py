@@ -0,0 +1,212 @@
+from converter.constants import ColumnNameDtypeConstants
+from converter.constants import get_dd_mm_lookup
+from converter.constants import XmlConstants
+from converter.csv_parser import TypedCsvParser
+from converter.pgid_index import PgidBoundaryIndex
+from typing import Iterator
+from typing import List
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# nr of days before each month in (leap) dummy year 2000, so that day_of_year = _DAYS_BEFORE_MONTH[month - 1] + day
+_DAYS_BEFORE_MONTH = np.array([0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+
+# season indices: 0=eind_winter, 1=begin_zomer, 2=eind_zomer, 3=begin_winter
+_NR_SEASONS = 4
+
+
+class EventTableBuilder(ColumnNameDtypeConstants):
+    """
+    Build one long table with every xml event of every pgid and series (columns: pgid, parameterId, date, value),
+    computed with numpy datetime64 arithmetic over all csv rows at once instead of one python builder per csv row.
+
+    The same rules as timeseries_builder.BuilderBase.get_series apply:
+        - each csv row starts with an event at startdatum (level of the period that contains startdatum)
+        - then an event at each period start in between startdatum and einddatum
+        - the last csv row of a pgid ends with an event at einddatum (level of the period that contains einddatum),
+          for the other csv rows this event is dropped as the startdatum of the next csv row follows.
+
+    The events are ordered like the xml: per pgid, per series (XmlSeriesBuilder.series_constants), per csv row
+    (startdatum) and per date. The df must be validated (see ConvertCsvToXml.validate_df).
+    """
+
+    col_parameter_id = "parameterId"
+    col_date = "date"
+    col_value = "value"
+
+    def __init__(self, pgid_index: PgidBoundaryIndex):
+        self.pgid_index = pgid_index
+        self.df = pgid_index.df
+        self._event_table = None
+
+    @property
+    def event_table(self) -> pd.DataFrame:
+        if self._event_table is not None:
+            return self._event_table
+        self._event_table = self._create_event_table()
+        return self._event_table
+
+    def iter_pgid_series(self) -> Iterator[Tuple[str, List[Tuple[np.ndarray, np.ndarray]]]]:
+        """Yield per pgid (ordered like self.df) the pgid and the (dates, values) of each series (in xml order)."""
+        event_table = self.event_table
+        pgid_codes = event_table[self.col_pgid].cat.codes.to_numpy()
+        series_codes = event_table[self.col_parameter_id].cat.codes.to_numpy()
+        nr_series = len(event_table[self.col_parameter_id].cat.categories)
+        dates = event_table[self.col_date].to_numpy()
+        values = event_table[self.col_value].to_numpy()
+
+        # the events are ordered, so each series of each pgid is one slice. Each pgid has all series (each csv row
+        # has at least a startdatum event per series)
+        segment_keys = pgid_codes.astype(np.int64) * nr_series + series_codes
+        segment_starts = np.flatnonzero(np.diff(segment_keys, prepend=-1))
+        segment_stops = np.append(segment_starts[1:], len(segment_keys))
+        pgids = event_table[self.col_pgid].cat.categories
+        assert len(segment_starts) == len(pgids) * nr_series, "code error: each pgid must have all series"
+        for pgid_index, pgid in enumerate(pgids):
+            all_series = []
+            for segment_index in range(pgid_index * nr_series, (pgid_index + 1) * nr_series):
+                _slice = slice(segment_starts[segment_index], segment_stops[segment_index])
+                all_series.append((dates[_slice], values[_slice]))
+            yield pgid, all_series
+
+    @staticmethod
+    def _get_month_day_of_year(dates: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get month, day and day_of_year (in dummy year 2000) from datetime64[D] dates."""
+        months = (dates.astype("datetime64[M]") - dates.astype("datetime64[Y]")).astype(int) + 1
+        days = (dates - dates.astype("datetime64[M]")).astype(int) + 1
+        return months, days, _DAYS_BEFORE_MONTH[months - 1] + days
+
+    def _get_season_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns 3 arrays (shape nr_rows x 4) with month, day and day_of_year of the 4 season dates."""
+        season_cols = [self.col_eind_winter, self.col_begin_zomer, self.col_eind_zomer, self.col_begin_winter]
+        arrays = []
+        for tuple_index in range(3):  # (month, day, day_of_year)
+            mapper = {dd_mm: values[tuple_index] for dd_mm, values in get_dd_mm_lookup().items()}
+            df_mapped = pd.DataFrame({col: self.df[col].astype(str).map(mapper) for col in season_cols})
+            assert not df_mapped.isna().any().any(), "code error: season dates must be validated"
+            arrays.append(df_mapped.to_numpy(dtype=int))
+        months, days, day_of_years = arrays
+        assert (np.diff(day_of_years, axis=1) > 0).all(), "code error: season dates must be ordered"
+        return months, days, day_of_years
+
+    def _get_breakpoints(
+        self, startdatum: np.ndarray, einddatum: np.ndarray, season_months: np.ndarray, season_days: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get all season dates in between startdatum and einddatum (both excluded) of all csv rows. Returns 3 flat
+        arrays: row position, date and season index. Per csv row the dates are ordered.
+        """
+        start_years = startdatum.astype("datetime64[Y]").astype(int) + 1970
+        end_years = einddatum.astype("datetime64[Y]").astype(int) + 1970
+        nr_years = np.where(startdatum < einddatum, end_years - start_years + 1, 0)
+        year_rows = np.repeat(np.arange(len(startdatum)), nr_years)
+        year_offsets = np.arange(len(year_rows)) - np.repeat(np.cumsum(nr_years) - nr_years, nr_years)
+        years = start_years[year_rows] + year_offsets
+
+        # shape (nr_year_rows, 4): a date for each season in each year of each csv row
+        first_day_of_years = (years - 1970).astype("datetime64[Y]").astype("datetime64[M]")
+        dates = (first_day_of_years[:, None] + (season_months[year_rows] - 1)).astype("datetime64[D]")
+        dates = dates + (season_days[year_rows] - 1)
+        mask = (startdatum[year_rows][:, None] < dates) & (dates < einddatum[year_rows][:, None])
+        rows = np.broadcast_to(year_rows[:, None], dates.shape)
+        seasons = np.broadcast_to(np.arange(_NR_SEASONS), dates.shape)
+        return rows[mask], dates[mask], seasons[mask]
+
+    @staticmethod
+    def _get_season_index_in_between(day_of_years: np.ndarray, season_day_of_years: np.ndarray, kind: str):
+        """
+        Vectorized timeseries_builder.BuilderBase.get_period_in_between_date: get the season index of the period that
+        contains day_of_year. Like get_period_in_between_date, a day_of_year equal to the end of a period belongs to
+        that period (and not to the next one).
+        """
+        eind_winter, begin_zomer, eind_zomer, begin_winter = [season_day_of_years[:, x] for x in range(_NR_SEASONS)]
+        if kind == "peilbesluitpeil":
+            conditions = [
+                (eind_winter <= day_of_years) & (day_of_years <= begin_zomer),
+                (begin_zomer <= day_of_years) & (day_of_years <= eind_zomer),
+                (eind_zomer <= day_of_years) & (day_of_years <= begin_winter),
+            ]
+            return np.select(conditions, [0, 1, 2], default=3)
+        if kind == "ondergrens":
+            return np.where((begin_zomer <= day_of_years) & (day_of_years <= eind_zomer), 1, 2)
+        if kind == "bovengrens":
+            return np.where((eind_winter <= day_of_years) & (day_of_years <= begin_winter), 0, 3)
+        raise AssertionError(f"code error: unknown kind {kind}")
+
+    def _get_series_specs(self) -> List[Tuple[str, str, np.ndarray]]:
+        """
+        Returns per series (in xml order): parameter_id, kind and levels (shape nr_rows x 4, one level per season
+        index where a period starts, nan if no period starts there). Levels are computed like timeseries_builder.
+        """
+        zomerpeil = TypedCsvParser.get_float64(values=self.df[self.col_zomerpeil])
+        winterpeil = TypedCsvParser.get_float64(values=self.df[self.col_winterpeil])
+        nan = np.full(len(self.df), np.nan)
+        water_level_in_overgangs_period = (zomerpeil + winterpeil) / 2
+
+        def get_marge(col: str) -> np.ndarray:
+            return TypedCsvParser.get_float64(values=self.df[col]) / 100  # convert from cm to m
+
+        def onder(marge: np.ndarray) -> np.ndarray:
+            return np.column_stack([nan, zomerpeil - marge, winterpeil - marge, nan])
+
+        def boven(marge: np.ndarray) -> np.ndarray:
+            return np.column_stack([zomerpeil + marge, nan, nan, winterpeil + marge])
+
+        peil = [water_level_in_overgangs_period, zomerpeil, water_level_in_overgangs_period, winterpeil]
+        return [
+            (XmlConstants.peilbesluitpeil.parameter_id, "peilbesluitpeil", np.column_stack(peil)),
+            (XmlConstants.eerste_ondergrens.parameter_id, "ondergrens", onder(get_marge(self.col_1e_marge_onder))),
+            (XmlConstants.tweede_ondergrens.parameter_id, "ondergrens", onder(get_marge(self.col_2e_marge_onder))),
+            (XmlConstants.eerste_bovengrens.parameter_id, "bovengrens", boven(get_marge(self.col_1e_marge_boven))),
+            (XmlConstants.tweede_bovengrens.parameter_id, "bovengrens", boven(get_marge(self.col_2e_marge_boven))),
+        ]
+
+    def _create_event_table(self) -> pd.DataFrame:
+        nr_rows = len(self.df)
+        startdatum = self.df[self.col_startdatum].to_numpy().astype("datetime64[D]")
+        einddatum = self.df[self.col_einddatum].to_numpy().astype("datetime64[D]")
+        row_positions = np.arange(nr_rows)
+        last_rows = self.pgid_index.stops - 1
+        pgid_numbers = self.pgid_index.get_pgid_numbers()
+
+        season_months, season_days, season_day_of_years = self._get_season_arrays()
+        _, _, start_day_of_years = self._get_month_day_of_year(dates=startdatum)
+        _, _, end_day_of_years = self._get_month_day_of_year(dates=einddatum)
+        bp_rows, bp_dates, bp_seasons = self._get_breakpoints(
+            startdatum=startdatum, einddatum=einddatum, season_months=season_months, season_days=season_days
+        )
+
+        series_specs = self._get_series_specs()
+        parts = []  # (series_index, row positions, dates, values)
+        for series_index, (_, kind, levels) in enumerate(series_specs):
+            start_seasons = self._get_season_index_in_between(start_day_of_years, season_day_of_years, kind=kind)
+            end_seasons = self._get_season_index_in_between(end_day_of_years, season_day_of_years, kind=kind)
+            bp_levels = levels[bp_rows, bp_seasons]
+            mask_bp = ~np.isnan(bp_levels)
+            parts.append((series_index, row_positions, startdatum, levels[row_positions, start_seasons]))
+            parts.append((series_index, bp_rows[mask_bp], bp_dates[mask_bp], bp_levels[mask_bp]))
+            parts.append((series_index, last_rows, einddatum[last_rows], levels[last_rows, end_seasons[last_rows]]))
+
+        series_indices = np.concatenate([np.full(len(rows), index) for index, rows, _, _ in parts])
+        rows = np.concatenate([rows for _, rows, _, _ in parts])
+        dates = np.concatenate([dates for _, _, dates, _ in parts])
+        values = np.concatenate([values for _, _, _, values in parts])
+
+        # order by (pgid, series, csv row). Within a csv row the parts are already ordered by date (start, period
+        # starts, end) so a stable sort on one int64 key is enough
+        nr_series = len(series_specs)
+        sort_key = (pgid_numbers[rows].astype(np.int64) * nr_series + series_indices) * nr_rows + rows
+        order = np.argsort(sort_key, kind="stable")
+        rows = rows[order]
+        parameter_ids = [parameter_id for parameter_id, _, _ in series_specs]
+        return pd.DataFrame(
+            {
+                self.col_pgid: pd.Categorical.from_codes(codes=pgid_numbers[rows], categories=self.pgid_index.pgids),
+                self.col_parameter_id: pd.Categorical.from_codes(codes=series_indices[order], categories=parameter_ids),
+                self.col_date: dates[order].astype("datetime64[s]"),
+                self.col_value: values[order],
+            }
+        )
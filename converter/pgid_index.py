@@ -0,0 +1,109 @@
+from converter.constants import ColumnNameDtypeConstants
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class PgidBoundaryIndex(ColumnNameDtypeConstants):
+    """
+    The df sorted once by (pgid, startdatum) and the boundaries of each pgid in it, computed from where the pgid
+    changes: starts[i]:stops[i] are the row positions of the i-th pgid. Validation (check 6), the event table and the
+    xml all slice from these boundaries instead of grouping or sorting by pgid again:
+        - the sort is skipped if df is already sorted (e.g. the validated df, or a batch in streaming mode)
+        - the sort is stable (mergesort), so rows with the same pgid and startdatum keep the csv order
+        - rows without pgid (NaN) are sorted last, and each is a 'pgid' of its own
+    The index is built once (see ConvertCsvToXml.validate_df): select() and split() derive the index of a subset of
+    the pgids from the boundaries, without sorting or comparing the pgids again.
+    """
+
+    def __init__(self, df: pd.DataFrame, is_first_row: Optional[np.ndarray] = None):
+        """With is_first_row (per row: True if the row starts a pgid), df must be sorted by (pgid, startdatum)."""
+        if is_first_row is None:
+            self.df = df if self.is_sorted(df=df) else df.sort_values(by=self.sort_cols, kind="mergesort")
+            pgids = self.df[self.col_pgid].to_numpy()
+            is_first_row = np.ones(len(pgids), dtype=bool)
+            is_first_row[1:] = pgids[1:] != pgids[:-1]
+        else:
+            assert len(is_first_row) == len(df), "code error: is_first_row must have a value per row"
+            self.df = df
+        nr_rows = len(self.df)
+        self.is_first_row = is_first_row
+        self.starts = np.flatnonzero(self.is_first_row)
+        self.stops = np.append(self.starts[1:], nr_rows)[: len(self.starts)]
+        self.is_last_row = np.zeros(nr_rows, dtype=bool)
+        self.is_last_row[self.stops - 1] = True
+        self.pgids = self.df[self.col_pgid].to_numpy()[self.starts]
+
+    @property
+    def sort_cols(self):
+        return [self.col_pgid, self.col_startdatum]
+
+    @classmethod
+    def is_sorted(cls, df: pd.DataFrame) -> bool:
+        """True if df is sorted by (pgid, startdatum), checked in one vectorized pass. False if a value is NaN."""
+        if len(df) < 2:
+            return True
+        pgids = df[cls.col_pgid]
+        startdatum = df[cls.col_startdatum]
+        if pgids.isna().any() or startdatum.isna().any():
+            return False
+        pgids = pgids.to_numpy()
+        startdatum = startdatum.to_numpy()
+        is_same_pgid = pgids[1:] == pgids[:-1]
+        return bool(((pgids[1:] > pgids[:-1]) | (is_same_pgid & (startdatum[1:] >= startdatum[:-1]))).all())
+
+    def __len__(self) -> int:
+        """The nr of pgids."""
+        return len(self.starts)
+
+    def get_pgid_numbers(self) -> np.ndarray:
+        """Per row (of self.df) the number (0, 1, ..) of its pgid."""
+        return np.cumsum(self.is_first_row) - 1
+
+    def select(self, mask_pgid: np.ndarray) -> "PgidBoundaryIndex":
+        """The index of the pgids where mask_pgid (a bool per pgid) is True, e.g. the pgids without errors."""
+        mask_row = np.repeat(mask_pgid, self.stops - self.starts)
+        return PgidBoundaryIndex(df=self.df[mask_row], is_first_row=self.is_first_row[mask_row])
+
+    def split(self, nr_chunks: int) -> List["PgidBoundaryIndex"]:
+        """Split in <= nr_chunks indexes of about the same nr of pgids (sorted). All rows of a pgid are in one chunk."""
+        chunk_numbers = self.get_pgid_numbers() * nr_chunks // max(len(self), 1)
+        row_bounds = np.searchsorted(chunk_numbers, np.arange(nr_chunks + 1))
+        return [
+            self._slice_rows(start=start, stop=stop)
+            for start, stop in zip(row_bounds[:-1], row_bounds[1:])
+            if stop > start
+        ]
+
+    def iter_row_chunks(self, chunk_size: int) -> Iterator["PgidBoundaryIndex"]:
+        """
+        Yield the index in chunks of whole pgids with <= chunk_size rows each (a chunk is larger only if one pgid has
+        more rows), so that what is computed per chunk is bounded by chunk_size and not by the size of self.df.
+        """
+        assert chunk_size > 0
+        pgid_bounds = np.append(self.starts, len(self.df))
+        start = 0
+        while start < len(self.df):
+            # the last pgid bound within chunk_size rows, or else the end of the (large) pgid at start
+            stop = pgid_bounds[np.searchsorted(pgid_bounds, start + chunk_size, side="right") - 1]
+            if stop <= start:
+                stop = pgid_bounds[np.searchsorted(pgid_bounds, start, side="right")]
+            yield self._slice_rows(start=start, stop=stop)
+            start = stop
+
+    def _slice_rows(self, start: int, stop: int) -> "PgidBoundaryIndex":
+        """The index of rows start:stop, that must be the bounds of pgids."""
+        return PgidBoundaryIndex(df=self.df.iloc[start:stop], is_first_row=self.is_first_row[start:stop])
+
+    def iter_pgid_headers(self) -> Iterator[Tuple[str, pd.Timestamp, pd.Timestamp]]:
+        """
+        Yield per pgid (sorted) the pgid, and the startdatum and einddatum of its first row (e.g. for the xml header),
+        taken from the columns at self.starts (so without a df slice per pgid).
+        """
+        startdatums = self.df[self.col_startdatum].iloc[self.starts]
+        einddatums = self.df[self.col_einddatum].iloc[self.starts]
+        yield from zip(self.pgids, startdatums, einddatums)
@@ -0,0 +1,115 @@
+from converter import constants
+from converter.utils import atomic_write
+from converter.utils import get_file_hash
+from pathlib import Path
+
+import hashlib
+import json
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalStagingCopy:
+    """
+    Read-through local copy of files on a (slow) network drive, e.g. the GIS exports in PEILMARGE_GIS_EXPORT_DIR:
+        - stage(source_path) copies the file once to staging_dir in large sequential blocks (block_size bytes). The
+          copy is verified: the source must have the same size and mtime before and after copying, and the copy must
+          have the same size and sha256 as what was read from the source
+        - a later stage(source_path) only stats the source: if its size and mtime did not change, the local copy is
+          used without reading the network drive again
+        - the staging dir is limited to max_size_bytes: after a copy, the least recently used other copies are removed
+          (a stage() of an up to date copy touches it)
+    Each source path has its own local copy (with a .json with its size, mtime and sha256), so this works for any
+    file, e.g. all exports in one directory.
+    """
+
+    def __init__(
+        self,
+        staging_dir: Path = constants.STAGING_DIR,
+        block_size: int = constants.STAGING_BLOCK_SIZE,
+        max_size_bytes: int = constants.STAGING_MAX_SIZE_BYTES,
+    ):
+        assert block_size > 0, f"block_size must be > 0, but found {block_size}"
+        assert max_size_bytes > 0, f"max_size_bytes must be > 0, but found {max_size_bytes}"
+        self.staging_dir = staging_dir
+        self.block_size = block_size
+        self.max_size_bytes = max_size_bytes
+
+    def get_local_path(self, source_path: Path) -> Path:
+        source_hash = hashlib.sha256(source_path.resolve().as_posix().encode()).hexdigest()[:16]
+        return self.staging_dir / f"{source_hash}_{source_path.name}"
+
+    @staticmethod
+    def _get_meta_path(local_path: Path) -> Path:
+        return local_path.with_name(f"{local_path.name}.json")
+
+    def is_up_to_date(self, source_path: Path) -> bool:
+        local_path = self.get_local_path(source_path=source_path)
+        meta_path = self._get_meta_path(local_path=local_path)
+        if not local_path.is_file() or not meta_path.is_file():
+            return False
+        meta = json.loads(meta_path.read_text())
+        source_stat = source_path.stat()
+        return (
+            meta["size"] == source_stat.st_size == local_path.stat().st_size
+            and meta["mtime_ns"] == source_stat.st_mtime_ns
+        )
+
+    def _copy(self, source_path: Path, local_path: Path) -> None:
+        stat_before = source_path.stat()
+        source_hash = hashlib.sha256()
+        with atomic_write(path=local_path) as tmp_path:
+            with open(source_path.as_posix(), mode="rb") as source_file, open(
+                tmp_path.as_posix(), mode="wb"
+            ) as tmp_file:
+                for block in iter(lambda: source_file.read(self.block_size), b""):
+                    source_hash.update(block)
+                    tmp_file.write(block)
+            stat_after = source_path.stat()
+            is_changed = (stat_before.st_size, stat_before.st_mtime_ns) != (stat_after.st_size, stat_after.st_mtime_ns)
+            is_verified = tmp_path.stat().st_size == stat_after.st_size and (
+                get_file_hash(path=tmp_path, block_size=self.block_size) == source_hash.hexdigest()
+            )
+            if is_changed or not is_verified:
+                raise AssertionError(f"could not copy {source_path} to {local_path}, changed={is_changed}")
+        meta = {
+            "source_path": source_path.as_posix(),
+            "size": stat_after.st_size,
+            "mtime_ns": stat_after.st_mtime_ns,
+            "sha256": source_hash.hexdigest(),
+        }
+        with atomic_write(path=self._get_meta_path(local_path=local_path)) as tmp_path:
+            tmp_path.write_text(json.dumps(meta, indent=4))
+
+    def stage(self, source_path: Path) -> Path:
+        """The path of the verified local copy of source_path (copied first if it does not exist or is outdated)."""
+        assert source_path.is_file(), f"file {source_path} does not exist"
+        local_path = self.get_local_path(source_path=source_path)
+        if self.is_up_to_date(source_path=source_path):
+            logger.info(f"using local copy {local_path} of {source_path}")
+            os.utime(local_path.as_posix())  # mark as recently used
+            return local_path
+        logger.info(f"copying {source_path} to {local_path}")
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self._get_meta_path(local_path=local_path).unlink(missing_ok=True)
+        self._copy(source_path=source_path, local_path=local_path)
+        self.evict(keep_path=local_path)
+        return local_path
+
+    def evict(self, keep_path: Path) -> None:
+        """Remove the least recently used copies (except keep_path) until the staging dir is <= max_size_bytes."""
+        local_paths = [x.with_suffix("") for x in self.staging_dir.glob("*.json")]
+        entries = [(x.stat().st_mtime_ns, x.stat().st_size, x) for x in local_paths if x.is_file()]
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            if path == keep_path:
+                continue
+            logger.info(f"removing least recently used local copy {path}")
+            self._get_meta_path(local_path=path).unlink()
+            path.unlink()
+            total_size -= size
@@ -0,0 +1,212 @@
+from converter import constants
+from converter.convert import ConvertCsvToXml
+from converter.csv_parser import TypedCsvParser
+from converter.error_store import CsvErrorStore
+from converter.pgid_index import PgidBoundaryIndex
+from pathlib import Path
+from typing import Iterator
+from typing import List
+
+import logging
+import numpy as np
+import pandas as pd
+import pickle
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+
+def _spill_blocks(df: pd.DataFrame, spill_file, block_size: int) -> None:
+    for start in range(0, len(df), block_size):
+        end = start + block_size
+        pickle.dump(df.iloc[start:end], spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _iter_spilled_blocks(spill_path: Path) -> Iterator[pd.DataFrame]:
+    with open(spill_path.as_posix(), mode="rb") as spill_file:
+        while True:
+            try:
+                yield pickle.load(spill_file)
+            except EOFError:
+                return
+
+
+class StreamingConvertCsvToXml(ConvertCsvToXml):
+    """
+    Same output as ConvertCsvToXml.run(), but the csv is never loaded as a whole, so that we can convert very large
+    GIS exports with bounded memory:
+        1) read the csv in chunks (chunk_size rows): check 1 per row, and spill each chunk (sorted by pgid and
+           startdatum) to disk as a 'run' in blocks of block_size rows. This is an external sort, since the csv rows
+           are not sorted by pgid
+        2) merge the runs into batches that contain all rows of one or more pgids (sorted by pgid): check 2 to 6.
+           The rows of pgids without errors are written to the csv for the xml, and spilled as batches for the xml
+        3) read the csv in chunks again to write orig.csv and orig_with_errors.csv (now all errors are known)
+        4) create the xml from the spilled batches
+    Peak memory is bounded by chunk_size + nr_runs * block_size rows (plus the rows of the largest pgid), not by the
+    size of the csv. Only the error masks of all rows are kept in memory (see CsvErrorStore).
+    """
+
+    def __init__(
+        self,
+        orig_csv_path: Path,
+        chunk_size: int = constants.STREAMING_CHUNK_SIZE,
+        block_size: int = constants.STREAMING_BLOCK_SIZE,
+        collect_all_errors: bool = False,
+    ):
+        super().__init__(orig_csv_path=orig_csv_path, collect_all_errors=collect_all_errors)
+        assert chunk_size > 0 and block_size > 0
+        self.chunk_size = chunk_size
+        self.block_size = block_size
+        self._parser = TypedCsvParser(path=orig_csv_path)
+        self._error_store = CsvErrorStore()
+        self._nr_xml_pgids = None
+        self._xml_batches_path = None
+
+    @property
+    def df(self) -> pd.DataFrame:
+        raise AssertionError("code error: streaming mode does not load the whole csv, use run()")
+
+    def _iter_csv_chunks(self) -> Iterator[pd.DataFrame]:
+        """The csv in chunks of chunk_size rows. The index is the csv row (same as the index of ConvertCsvToXml.df)."""
+        return self._parser.iter_chunks(chunk_size=self.chunk_size)
+
+    def _spill_sorted_runs(self, spill_dir: Path) -> List[Path]:
+        """Step 1: check 1 per chunk and spill each sorted chunk as a run. Return the paths of the runs."""
+        run_paths = []
+        nr_rows = 0
+        for df_chunk in self._iter_csv_chunks():
+            nr_rows += len(df_chunk)
+            if not self.collect_all_errors:
+                self._check_season_dates_are_ordered(df=df_chunk)
+            mask_no_pgid = df_chunk[self.col_pgid].isna()
+            if mask_no_pgid.any():
+                # rows without pgid are not merged into a pgid, so we check them (check 0 to 5) right away
+                self._add_row_csv_errors(df=df_chunk[mask_no_pgid], error_store=self._error_store)
+            df_sorted = df_chunk[~mask_no_pgid].sort_values(by=[self.col_pgid, self.col_startdatum], kind="mergesort")
+            run_path = spill_dir / f"run_{len(run_paths)}.pickle"
+            with open(run_path.as_posix(), mode="wb") as spill_file:
+                _spill_blocks(df=df_sorted, spill_file=spill_file, block_size=self.block_size)
+            run_paths.append(run_path)
+        assert nr_rows, f"csv {self.orig_csv_path} has no rows"
+        logger.info(f"read {nr_rows} csv rows and spilled them as {len(run_paths)} sorted runs")
+        return run_paths
+
+    def _iter_merged_batches(self, run_paths: List[Path]) -> Iterator[pd.DataFrame]:
+        """
+        Step 2a: k-way merge of the sorted runs. Each run has a buffer with its rows that are not yielded yet. All
+        buffered rows with a pgid lower than the lowest 'last buffered pgid' of the unfinished runs are complete, so
+        these are yielded as one batch (sorted by pgid and startdatum). Then the runs that determined that pgid read
+        their next block. Equal keys keep the csv order, since runs and rows within a run are in csv order.
+        """
+        run_readers = []
+        buffers = []
+        for run_path in run_paths:
+            run_reader = _iter_spilled_blocks(spill_path=run_path)
+            first_block = next(run_reader, None)
+            if first_block is not None:
+                run_readers.append(run_reader)
+                buffers.append(first_block)
+        is_finished = [False] * len(buffers)
+        while buffers:
+            last_pgids = [buffer[self.col_pgid].iloc[-1] for buffer, done in zip(buffers, is_finished) if not done]
+            bound_pgid = min(last_pgids) if last_pgids else None
+            batch_parts = []
+            for run_nr, buffer in enumerate(buffers):
+                pgids = buffer[self.col_pgid].to_numpy()
+                nr_complete = len(pgids) if bound_pgid is None else np.searchsorted(pgids, bound_pgid, side="left")
+                batch_parts.append(buffer.iloc[:nr_complete])
+                buffers[run_nr] = buffer.iloc[nr_complete:]
+            df_batch = pd.concat(batch_parts)
+            if not df_batch.empty:
+                yield df_batch.sort_values(by=[self.col_pgid, self.col_startdatum], kind="mergesort")
+            if bound_pgid is None:
+                return
+            for run_nr, run_reader in enumerate(run_readers):
+                if is_finished[run_nr] or buffers[run_nr][self.col_pgid].iloc[-1] != bound_pgid:
+                    continue
+                block = next(run_reader, None)
+                if block is None:
+                    is_finished[run_nr] = True
+                else:
+                    buffers[run_nr] = pd.concat([buffers[run_nr], block])
+
+    def _validate_batches(self, run_paths: List[Path], xml_batches_path: Path) -> None:
+        """
+        Step 2b: check 2 to 6 per merged batch (all rows of a pgid are in one batch). Write the rows of pgids without
+        errors to the csv for the xml and spill them to xml_batches_path.
+        """
+        csv_source_path = self.output_dir / "without_errors_that_will_be_used_for_FEWS_WIS_xml.csv"
+        logger.info(f"specific validating csv {self.orig_csv_path}, creating {csv_source_path}")
+        nr_pgid_with_error = 0
+        nr_rows_with_error = 0
+        self._nr_xml_pgids = 0
+        with open(csv_source_path.as_posix(), mode="w", encoding="utf-8", newline="") as csv_file, open(
+            xml_batches_path.as_posix(), mode="wb"
+        ) as spill_file:
+            pd.DataFrame(columns=self.all_cols).to_csv(path_or_buf=csv_file, sep=",", index=False)
+            for df_batch in self._iter_merged_batches(run_paths=run_paths):
+                pgid_index = PgidBoundaryIndex(df=df_batch)
+                self._add_row_csv_errors(df=df_batch, error_store=self._error_store)
+                self._add_connect_csv_errors(df=df_batch, error_store=self._error_store, pgid_index=pgid_index)
+
+                # remove all pgids that have 1 or more errors
+                mask_pgid_error = df_batch[self.col_pgid].isin(self._error_store.get_error_pgids(df=df_batch))
+                nr_pgid_with_error += df_batch.loc[mask_pgid_error, self.col_pgid].nunique()
+                nr_rows_with_error += mask_pgid_error.sum()
+                df_batch = df_batch[~mask_pgid_error]
+                if df_batch.empty:
+                    continue
+                df_batch.to_csv(path_or_buf=csv_file, sep=",", index=False, header=False)
+                _spill_blocks(df=df_batch, spill_file=spill_file, block_size=len(df_batch))
+                self._nr_xml_pgids += df_batch[self.col_pgid].nunique()
+
+        if nr_pgid_with_error or nr_rows_with_error:
+            logger.warning(f"found {nr_pgid_with_error} pgid with an error, and {nr_rows_with_error} with an error")
+            logger.warning(f"deleting {nr_rows_with_error} rows")
+        else:
+            logger.info("no errors found! :)")
+        self.rule_engine.log_timings()
+
+    def _write_orig_csvs(self) -> None:
+        """Step 3: read the csv in chunks again, now all errors are known."""
+        csv_orig = self.output_dir / "orig.csv"
+        df_error_path = self.output_dir / "orig_with_errors.csv"
+        logger.info(f"creating {csv_orig} and {df_error_path}")
+        with open(csv_orig.as_posix(), mode="w", encoding="utf-8", newline="") as csv_orig_file, open(
+            df_error_path.as_posix(), mode="w", encoding="utf-8", newline=""
+        ) as df_error_file:
+            chunks = self._parser.iter_chunks_with_invalid_cells(chunk_size=self.chunk_size)
+            for chunk_nr, (df_chunk, invalid_cells) in enumerate(chunks):
+                df_chunk = self._parser.with_invalid_cells(df=df_chunk, invalid_cells=invalid_cells)
+                df_chunk.to_csv(path_or_buf=csv_orig_file, sep=",", index=False, header=chunk_nr == 0)
+                self._write_csv_with_errors(
+                    df=df_chunk, error_store=self._error_store, csv_file=df_error_file, header=chunk_nr == 0
+                )
+
+    def _get_nr_xml_pgids(self) -> int:
+        return self._nr_xml_pgids
+
+    def _iter_all_xml_fragments(self) -> Iterator[str]:
+        """Step 4: the spilled batches are sorted by pgid, and each batch contains all rows of its pgids."""
+        for df_batch in _iter_spilled_blocks(spill_path=self._xml_batches_path):
+            yield from self.iter_xml_fragments(pgid_index=PgidBoundaryIndex(df=df_batch))
+
+    def run(self):
+        logger.info(f"streaming {self.orig_csv_path} in chunks of {self.chunk_size} rows")
+        with tempfile.TemporaryDirectory(prefix="spill_", dir=self.output_dir.as_posix()) as spill_dir:
+            spill_dir = Path(spill_dir)
+            run_paths = self._spill_sorted_runs(spill_dir=spill_dir)
+            self._xml_batches_path = spill_dir / "xml_batches.pickle"
+            self._validate_batches(run_paths=run_paths, xml_batches_path=self._xml_batches_path)
+            for run_path in run_paths:
+                run_path.unlink()
+            self._write_orig_csvs()
+
+            # create .xml
+            if not constants.CREATE_XML:
+                logger.info("skip creating xml")
+                return
+            xml_path = self.output_dir / "PeilbesluitPi.xml"
+            logger.info(f"creating {xml_path}")
+            self._create_xml(xml_path=xml_path, create_small_xml=True)
@@ -0,0 +1,34 @@
+from converter.constants import PATH_CSV_TEST_INPUT
+from converter.constants import PATH_CSV_TEST_INPUT_WITH_ERRORS
+from converter.csv_cache import ParsedCsvCache
+from converter.csv_parser import TypedCsvParser
+
+import os
+import pandas as pd
+import shutil
+
+
+def test_cache_hit_miss_and_eviction(tmp_path, monkeypatch):
+    csv_path = tmp_path / "export.csv"
+    shutil.copy(PATH_CSV_TEST_INPUT, csv_path)
+    cache = ParsedCsvCache(cache_dir=tmp_path / "cache")
+    df_expected = TypedCsvParser(path=csv_path).read()
+
+    # miss: parse and save, hit: load without parsing
+    pd.testing.assert_frame_equal(cache.read(parser=TypedCsvParser(path=csv_path)), df_expected)
+    with monkeypatch.context() as patch:
+        patch.setattr(TypedCsvParser, "read", lambda _: None)
+        pd.testing.assert_frame_equal(cache.read(parser=TypedCsvParser(path=csv_path)), df_expected)
+    assert len(list(cache.cache_dir.iterdir())) == 1
+
+    # a changed csv is a new entry
+    shutil.copy(PATH_CSV_TEST_INPUT_WITH_ERRORS, csv_path)
+    df_changed = cache.read(parser=TypedCsvParser(path=csv_path))
+    pd.testing.assert_frame_equal(df_changed, TypedCsvParser(path=csv_path).read())
+    cache_paths = sorted(cache.cache_dir.iterdir(), key=os.path.getmtime)
+    assert len(cache_paths) == 2
+
+    # the least recently used entry is removed if the cache is too large
+    cache.max_size_bytes = cache_paths[-1].stat().st_size
+    cache.evict()
+    assert list(cache.cache_dir.iterdir()) == cache_paths[-1:]
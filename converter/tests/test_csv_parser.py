@@ -0,0 +1,124 @@
+from converter.constants import PATH_CSV_TEST_INPUT
+from converter.constants import PATH_CSV_TEST_INPUT_WITH_ERRORS
+from converter.convert import ConvertCsvToXml
+from converter.csv_parser import TypedCsvParser
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_typed_parsing(tmp_path):
+    # one row with a date, a peil and a marge that can not be converted, and one row with a decimal marge
+    lines = PATH_CSV_TEST_INPUT_WITH_ERRORS.read_text().splitlines()
+    lines[1] = "PG0403;2022010x;20221231;01-04;01-05;01-09;01-10;abc;-1.9;25;10;;25"
+    lines[2] = "PG0559;20220101;20221231;01-04;01-05;01-09;01-10;0.8;0.8;25;10.5;10;25"
+    csv_path = tmp_path / "typed.csv"
+    csv_path.write_text("\n".join(lines) + "\n")
+
+    df = TypedCsvParser(path=csv_path).read()
+    assert pd.api.types.is_datetime64_dtype(df["startdatum"])
+    assert isinstance(df["eind_winter"].dtype, pd.CategoricalDtype)
+    assert df["zomerpeil"].dtype == float
+    assert df["2e marge onder"].dtype == "Int64"
+    assert df["1e marge onder"].dtype == "Int64"  # a decimal marge is not truncated, but is NA
+    assert pd.isna(df.loc[1, "1e marge onder"])
+    assert df.loc[0, ["startdatum", "zomerpeil", "1e marge boven"]].isna().all()
+    assert df.loc[2:, "1e marge onder"].notna().all()
+
+    # the cells that could not be converted are row errors, the other rows are typed anyway
+    data_converter = ConvertCsvToXml(orig_csv_path=csv_path)
+    data_converter._outputdir = tmp_path
+    data_converter.validate_df()
+    df_error = pd.read_csv(tmp_path / "orig_with_errors.csv", dtype=str)
+    errors = df_error.loc[0, "error"].split(" | ")
+    assert errors[:3] == [
+        "startdatum is empty or is not a yyyymmdd date",
+        "zomerpeil is empty or is not a number",
+        "1e marge boven is empty or is not an integer",
+    ]
+    assert df_error.loc[1, "error"].split(" | ")[0] == "1e marge onder is empty or is not an integer"
+    assert "PG0403" not in data_converter.df["pgid"].values
+    assert "PG0559" not in data_converter.df["pgid"].values
+
+    # the cells that could not be converted keep their original text, the other cells are not changed
+    assert df_error.loc[0, ["startdatum", "zomerpeil"]].tolist() == ["2022010x", "abc"]
+    assert pd.isna(df_error.loc[0, "1e marge boven"])
+    assert df_error.loc[1, "1e marge onder"] == "10.5"
+    assert df_error.loc[1, "startdatum"] == "2022-01-01"
+    assert df_error.loc[2:, "1e marge onder"].str.fullmatch(r"-?\d+").all()
+
+
+@pytest.mark.parametrize("orig_csv_path", [PATH_CSV_TEST_INPUT, PATH_CSV_TEST_INPUT_WITH_ERRORS])
+def test_compact_equals_default(tmp_path, orig_csv_path):
+    output_files = {}
+    for compact in (False, True):
+        data_converter = ConvertCsvToXml(orig_csv_path=orig_csv_path, compact=compact)
+        data_converter._outputdir = tmp_path / f"compact_{compact}"
+        data_converter._outputdir.mkdir()
+        data_converter.run()
+        output_files[compact] = {x.name: x.read_bytes() for x in data_converter.output_dir.iterdir()}
+
+    assert data_converter.df["zomerpeil"].dtype == np.float32
+    assert data_converter.df["2e marge onder"].dtype == pd.Int16Dtype()
+    assert output_files[True] == output_files[False]
+
+
+def test_flexible_csv_formats(tmp_path):
+    # comma separated, utf-8 with byte order mark, windows line endings and spaces around the header columns
+    df_expected = TypedCsvParser(path=PATH_CSV_TEST_INPUT_WITH_ERRORS).read()
+    lines = PATH_CSV_TEST_INPUT_WITH_ERRORS.read_text().splitlines()
+    lines[0] = ", ".join(lines[0].split(";"))
+    lines[1:] = [line.replace(";", ",") for line in lines[1:]]
+    csv_path = tmp_path / "flexible.csv"
+    csv_path.write_bytes(("\r\n".join(lines) + "\r\n").encode("utf-8-sig"))
+    parser = TypedCsvParser(path=csv_path)
+    assert parser.separator == ","
+    pd.testing.assert_frame_equal(parser.read(), df_expected)
+
+    # a row with too many fields is an error (not silently ignored)
+    lines[2] += ",99"
+    csv_path.write_text("\n".join(lines) + "\n")
+    with pytest.raises(AssertionError, match="csv error"):
+        TypedCsvParser(path=csv_path).read()
+
+
+@pytest.mark.parametrize("engine", TypedCsvParser.engines)
+@pytest.mark.parametrize("row", [1, 2, 4])
+def test_too_many_fields(tmp_path, engine, row):
+    if engine == "pyarrow":
+        pytest.importorskip("pyarrow")
+    # one extra field, also on the first data row (where pandas would use the first column as index)
+    lines = PATH_CSV_TEST_INPUT_WITH_ERRORS.read_text().splitlines()
+    lines[row] += ";99"
+    csv_path = tmp_path / "too_many_fields.csv"
+    csv_path.write_text("\n".join(lines) + "\n")
+    with pytest.raises(AssertionError, match="csv error"):
+        TypedCsvParser(path=csv_path, engine=engine).read()
+
+    # also if the row is the first row of a chunk
+    for chunk_size in (1, 2, 3):
+        with pytest.raises(AssertionError, match="csv error"):
+            list(TypedCsvParser(path=csv_path).iter_chunks(chunk_size=chunk_size))
+
+
+def test_iter_chunks_equals_read():
+    parser = TypedCsvParser(path=PATH_CSV_TEST_INPUT_WITH_ERRORS)
+    df = parser.parse(df=next(parser._iter_read_csv(chunk_size=None)))
+    for chunk_size in (1, 3, 1000):
+        df_chunks = pd.concat(parser.iter_chunks(chunk_size=chunk_size)).astype(df.dtypes.to_dict())
+        pd.testing.assert_frame_equal(df_chunks, df)
+
+
+@pytest.mark.parametrize("orig_csv_path", [PATH_CSV_TEST_INPUT, PATH_CSV_TEST_INPUT_WITH_ERRORS, None])
+def test_pyarrow_engine_equals_pandas(tmp_path, orig_csv_path):
+    pytest.importorskip("pyarrow")
+    if orig_csv_path is None:
+        # a cell that can not be converted: pyarrow falls back to pandas
+        lines = PATH_CSV_TEST_INPUT_WITH_ERRORS.read_text().splitlines()
+        lines[1] = "PG0403;2022010x;20221231;01-04;01-05;01-09;01-10;abc;-1.9;25;10;;25"
+        orig_csv_path = tmp_path / "typed.csv"
+        orig_csv_path.write_text("\n".join(lines) + "\n")
+    df_pandas = TypedCsvParser(path=orig_csv_path).read()
+    df_pyarrow = TypedCsvParser(path=orig_csv_path, engine="pyarrow").read()
+    pd.testing.assert_frame_equal(df_pyarrow, df_pandas)
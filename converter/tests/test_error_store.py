@@ -0,0 +1,39 @@
+from converter.error_store import CsvErrorStore
+
+import pandas as pd
+import pytest
+
+
+def test_error_store():
+    df = pd.DataFrame({"pgid": ["PG1", "PG1", "PG2", "PG3"], "peil": [1.0, 20.0, None, 30.0]})
+    error_store = CsvErrorStore()
+    error_store.add(rule="empty", mask_error=df["peil"].isna(), message="peil is empty")
+    error_store.add(rule="too high", mask_error=df["peil"] > 10, message="peil > 10")
+    # like in streaming mode: a subset of rows (index = csv row) and a rule with a message per row
+    df_subset = df.iloc[[3]]
+    details = {"peil": df_subset["peil"]}
+    error_store.add(rule="per row", mask_error=df_subset["peil"] > 25, message="row {row}: {peil}", details=details)
+
+    assert error_store.get_error_mask(index=df.index).tolist() == [False, True, True, True]
+    assert sorted(error_store.get_error_pgids(df=df)) == ["PG1", "PG2", "PG3"]
+    errors = error_store.get_error_column(index=df.index)
+    assert errors.tolist() == [None, "peil > 10", "peil is empty", "peil > 10 | row 3: 30.0"]
+    assert error_store.get_error_column(index=pd.RangeIndex(start=2, stop=6)).tolist()[2:] == [None, None]
+
+    # the errors of partitions of the rows (e.g. validated in worker processes) can be merged
+    error_store_merged = CsvErrorStore()
+    for rows in ([1, 3], [0, 2]):
+        error_store_partition = CsvErrorStore()
+        df_partition = df.iloc[rows]
+        error_store_partition.add(rule="empty", mask_error=df_partition["peil"].isna(), message="peil is empty")
+        error_store_partition.add(rule="too high", mask_error=df_partition["peil"] > 10, message="peil > 10")
+        details = {"peil": df_partition["peil"]}
+        mask_error = df_partition["peil"] > 25
+        error_store_partition.add(rule="per row", mask_error=mask_error, message="row {row}: {peil}", details=details)
+        error_store_merged.merge(other=error_store_partition)
+    assert error_store_merged.get_error_column(index=df.index).tolist() == errors.tolist()
+
+    # messages are rendered when written, and must not contain ',' (difficult in excel)
+    error_store.add(rule="comma", mask_error=df["peil"] == 1, message="peil, is 1")
+    with pytest.raises(AssertionError, match="avoid ','"):
+        error_store.get_error_column(index=df.index)
@@ -0,0 +1,81 @@
+from converter import timeseries_builder
+from converter.constants import ColumnNameDtypeConstants
+from converter.constants import DateFormats
+from converter.constants import PATH_CSV_TEST_INPUT
+from converter.convert import ConvertCsvToXml
+from converter.event_table import EventTableBuilder
+from converter.xml_builder import XmlSeriesBuilder
+from typing import List
+from typing import Tuple
+
+import pandas as pd
+
+
+C = ColumnNameDtypeConstants
+
+
+def get_row_builders(df_pgid_row: dict) -> List[timeseries_builder.BuilderBase]:
+    """The timeseries_builder of each of the 5 series of a csv row (same order as XmlSeriesBuilder.series_constants)."""
+    kwargs = dict(
+        pgid=str(df_pgid_row[C.col_pgid]),
+        startdatum=df_pgid_row[C.col_startdatum],
+        einddatum=df_pgid_row[C.col_einddatum],
+        zomerpeil=float(df_pgid_row[C.col_zomerpeil]),
+        winterpeil=float(df_pgid_row[C.col_winterpeil]),
+    )
+    eind_winter = str(df_pgid_row[C.col_eind_winter])
+    begin_zomer = str(df_pgid_row[C.col_begin_zomer])
+    eind_zomer = str(df_pgid_row[C.col_eind_zomer])
+    begin_winter = str(df_pgid_row[C.col_begin_winter])
+    onder = dict(begin_zomer=begin_zomer, eind_zomer=eind_zomer, **kwargs)
+    boven = dict(begin_winter=begin_winter, eind_winter=eind_winter, **kwargs)
+    seasons = dict(eind_winter=eind_winter, begin_zomer=begin_zomer, eind_zomer=eind_zomer, begin_winter=begin_winter)
+    return [
+        timeseries_builder.PeilbesluitPeil(**seasons, **kwargs),
+        timeseries_builder.Ondergrens(marge=float(df_pgid_row[C.col_1e_marge_onder]), **onder),
+        timeseries_builder.Ondergrens(marge=float(df_pgid_row[C.col_2e_marge_onder]), **onder),
+        timeseries_builder.Bovengrens(marge=float(df_pgid_row[C.col_1e_marge_boven]), **boven),
+        timeseries_builder.Bovengrens(marge=float(df_pgid_row[C.col_2e_marge_boven]), **boven),
+    ]
+
+
+def get_all_series(df_pgid: pd.DataFrame) -> List[List[Tuple[str, float]]]:
+    """
+    The reference for EventTableBuilder: for each of the 5 series the (<date yyyy-mm-dd>, <level>) of all csv rows of
+    one pgid, built per csv row with the builders of timeseries_builder.
+    """
+    all_series = [[] for _ in XmlSeriesBuilder.series_constants]
+    df_pgid_rows = df_pgid.to_dict(orient="records")
+    last_position = len(df_pgid_rows) - 1
+    for position, df_pgid_row in enumerate(df_pgid_rows):
+        for series_data, builder in zip(all_series, get_row_builders(df_pgid_row=df_pgid_row)):
+            row_series_data = builder.get_series(
+                is_first_pgid_csv_row=position == 0, is_last_pgid_csv_row=position == last_position
+            )
+            series_data.extend((date.strftime(DateFormats.yyyy_mm_dd.value), level) for date, level in row_series_data)
+    return all_series
+
+
+def test_event_table_equals_xml_series_builder(tmp_path):
+    data_converter = ConvertCsvToXml(orig_csv_path=PATH_CSV_TEST_INPUT)
+    data_converter._outputdir = tmp_path
+    data_converter.validate_df()
+
+    event_table = EventTableBuilder(pgid_index=data_converter.pgid_index).event_table
+    assert list(event_table.columns) == ["pgid", "parameterId", "date", "value"]
+
+    expected_events = []
+    for pgid, df_pgid in data_converter.df.groupby(by=data_converter.col_pgid):
+        for timeseries_constants, series_data in zip(XmlSeriesBuilder.series_constants, get_all_series(df_pgid)):
+            expected_events.extend(
+                [(pgid, timeseries_constants.parameter_id, date_str, level) for date_str, level in series_data]
+            )
+    events = list(
+        zip(
+            event_table["pgid"],
+            event_table["parameterId"],
+            event_table["date"].dt.strftime("%Y-%m-%d"),
+            event_table["value"],
+        )
+    )
+    assert events == expected_events
@@ -0,0 +1,15 @@
+from converter.constants import BASE_DIR
+
+import subprocess
+import sys
+
+
+def test_startup_does_not_import_heavy_modules():
+    # see benchmarks/benchmark_import_time.py for the timing budget
+    code = (
+        "import sys; import main; import converter.constants as constants; "
+        "assert constants.check_constants.cache_info().currsize == 0, 'paths are checked on import'; "
+        "heavy = [x for x in ('numpy', 'pandas', 'hdsr_wis_config_reader') if x in sys.modules]; "
+        "assert not heavy, f'startup imports {heavy}'"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=BASE_DIR.as_posix())
@@ -1,4 +1,7 @@
+from converter import constants
+from converter.constants import PATH_CSV_TEST_EXPECTED_ORIG_WITH_ERRORS
 from converter.constants import PATH_CSV_TEST_INPUT
+from converter.constants import PATH_CSV_TEST_INPUT_WITH_ERRORS
 from converter.constants import PATH_XML_TEST_EXPECTED_OUTPUT
 from converter.convert import ConvertCsvToXml
 from converter.tests.data.input.expected_df_with_errors import df_expected_with_errors
@@ -6,6 +9,7 @@ from pathlib import Path
 
 import filecmp
 import pandas as pd
+import pytest
 
 
 def test_integration(tmp_path):
@@ -30,3 +34,110 @@ def test_integration(tmp_path):
         f1=PATH_XML_TEST_EXPECTED_OUTPUT.as_posix(), f2=path_small.as_posix(), shallow=True
     )
     assert xml_equals_expected_xml
+
+
+def test_create_xml_error_leaves_no_xml(tmp_path, monkeypatch):
+    data_converter = ConvertCsvToXml(orig_csv_path=PATH_CSV_TEST_INPUT)
+    data_converter._outputdir = tmp_path
+    data_converter.validate_df()
+
+    def iter_xml_fragments_with_error():
+        yield from data_converter.iter_xml_fragments(pgid_index=data_converter.pgid_index.split(nr_chunks=2)[0])
+        raise ValueError("interrupted")
+
+    monkeypatch.setattr(data_converter, "_iter_all_xml_fragments", iter_xml_fragments_with_error)
+    xml_path = tmp_path / "xml" / "PeilbesluitPi.xml"
+    xml_path.parent.mkdir()
+    with pytest.raises(ValueError, match="interrupted"):
+        data_converter._create_xml(xml_path=xml_path, create_small_xml=True)
+    assert list(xml_path.parent.iterdir()) == []
+
+
+def test_validate_df_with_errors(tmp_path):
+    data_converter = ConvertCsvToXml(orig_csv_path=PATH_CSV_TEST_INPUT_WITH_ERRORS)
+    data_converter._outputdir = tmp_path
+    data_converter.validate_df()
+
+    # orig_with_errors.csv must be identical to the expected one (same error rows and error messages)
+    orig_with_errors_path = tmp_path / "orig_with_errors.csv"
+    assert orig_with_errors_path.is_file()
+    assert orig_with_errors_path.read_text() == PATH_CSV_TEST_EXPECTED_ORIG_WITH_ERRORS.read_text()
+
+    # all rows of a pgid with >=1 error are removed
+    pgids_with_error = ["PG0115", "PG0120", "PG0121", "PG0123", "PG0126", "PG0127"]
+    assert not data_converter.df[data_converter.col_pgid].isin(pgids_with_error).any()
+    assert len(data_converter.df) == 20
+
+
+def test_validate_df_collect_all_errors(tmp_path):
+    # 2 rows with season date errors (check 1): dates that are not ordered, and a dd-mm that is not valid
+    csv_text = PATH_CSV_TEST_INPUT_WITH_ERRORS.read_text()
+    csv_text = csv_text.replace("PG0403;20220101;20221231;01-04;01-05", "PG0403;20220101;20221231;01-06;01-05")
+    csv_text = csv_text.replace("01-04;01-05;01-09;01-10;0.8;0.8", "01-04;01-05;32-09;01-10;0.8;0.8", 1)
+    csv_path = tmp_path / "season_date_errors.csv"
+    csv_path.write_text(csv_text)
+
+    # by default we raise for the first row with a season date error
+    data_converter = ConvertCsvToXml(orig_csv_path=csv_path)
+    data_converter._outputdir = tmp_path
+    with pytest.raises(AssertionError, match="dates are not ordered, row=0"):
+        data_converter.validate_df()
+
+    # with collect_all_errors=True these rows are reported in orig_with_errors.csv like the other errors
+    data_converter = ConvertCsvToXml(orig_csv_path=csv_path, collect_all_errors=True)
+    data_converter._outputdir = tmp_path
+    data_converter.validate_df()
+    df_errors = pd.read_csv(tmp_path / "orig_with_errors.csv")
+    errors = df_errors["error"].fillna("")
+    assert errors[0] == "dates are not ordered as we expected eind_winter < begin_zomer < eind_zomer < begin_winter"
+    assert errors[1] == "eind_zomer is not a valid dd-mm date (e.g. 01-04 is April 1)"
+    # the other errors are reported as well (same as without season date errors)
+    df_expected = pd.read_csv(PATH_CSV_TEST_EXPECTED_ORIG_WITH_ERRORS)
+    assert (errors[2:] == df_expected["error"].fillna("")[2:]).all()
+    assert not data_converter.df[data_converter.col_pgid].isin(["PG0403", "PG0559"]).any()
+    assert len(data_converter.df) == 18
+
+
+def test_create_xml_with_workers(tmp_path):
+    data_converter = ConvertCsvToXml(orig_csv_path=PATH_CSV_TEST_INPUT)
+    data_converter._outputdir = tmp_path
+    data_converter.validate_df()
+    path_small, path_large = data_converter._create_xml(xml_path=tmp_path / "sequential.xml", create_small_xml=True)
+
+    # the xml rendered by worker processes must be identical to the sequentially rendered xml
+    data_converter_workers = ConvertCsvToXml(orig_csv_path=PATH_CSV_TEST_INPUT, workers=3)
+    data_converter_workers._outputdir = tmp_path
+    data_converter_workers.validate_df()
+    path_small_workers, path_large_workers = data_converter_workers._create_xml(
+        xml_path=tmp_path / "workers.xml", create_small_xml=True
+    )
+    assert path_small_workers.read_bytes() == path_small.read_bytes()
+    assert path_large_workers.read_bytes() == path_large.read_bytes()
+
+
+def test_create_xml_in_event_table_chunks(tmp_path, monkeypatch):
+    # the events are computed per chunk of pgids: the xml does not depend on the chunk size
+    data_converter = ConvertCsvToXml(orig_csv_path=PATH_CSV_TEST_INPUT)
+    data_converter._outputdir = tmp_path
+    data_converter.validate_df()
+    _, path_large = data_converter._create_xml(xml_path=tmp_path / "one_chunk.xml")
+    monkeypatch.setattr(constants, "XML_EVENT_TABLE_CHUNK_SIZE", 2)
+    _, path_large_chunks = data_converter._create_xml(xml_path=tmp_path / "chunks.xml")
+    assert path_large_chunks.read_bytes() == path_large.read_bytes()
+
+
+def test_validate_df_with_workers(tmp_path):
+    # parallel validation (pgid partitions) must give the same errors and df as sequential validation
+    data_converter = ConvertCsvToXml(orig_csv_path=PATH_CSV_TEST_INPUT_WITH_ERRORS, collect_all_errors=True)
+    data_converter._outputdir = tmp_path
+    data_converter.validate_df()
+    for workers in (2, 3):
+        data_converter_workers = ConvertCsvToXml(
+            orig_csv_path=PATH_CSV_TEST_INPUT_WITH_ERRORS, workers=workers, collect_all_errors=True
+        )
+        data_converter_workers._outputdir = tmp_path / f"workers_{workers}"
+        data_converter_workers._outputdir.mkdir()
+        data_converter_workers.validate_df()
+        orig_with_errors = data_converter_workers.output_dir / "orig_with_errors.csv"
+        assert orig_with_errors.read_text() == (data_converter.output_dir / "orig_with_errors.csv").read_text()
+        pd.testing.assert_frame_equal(data_converter_workers.df, data_converter.df)
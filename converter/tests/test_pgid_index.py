@@ -0,0 +1,62 @@
+from converter.constants import PATH_CSV_TEST_INPUT
+from converter.csv_parser import TypedCsvParser
+from converter.pgid_index import PgidBoundaryIndex
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_pgid_boundary_index():
+    df = TypedCsvParser(path=PATH_CSV_TEST_INPUT).read().sample(frac=1, random_state=1)
+    pgid_index = PgidBoundaryIndex(df=df)
+    df_expected = df.sort_values(by=["pgid", "startdatum"], kind="mergesort")
+    pd.testing.assert_frame_equal(pgid_index.df, df_expected)
+    assert list(pgid_index.pgids) == list(df_expected["pgid"].unique())
+
+    # each slice has all rows of one pgid, and the first/last row flags are the slice bounds
+    pgid_slices = zip(pgid_index.pgids, pgid_index.starts, pgid_index.stops)
+    for (pgid, start, stop), (_pgid, df_group) in zip(pgid_slices, df_expected.groupby("pgid", sort=True)):
+        assert pgid == _pgid
+        pd.testing.assert_frame_equal(pgid_index._slice_rows(start=start, stop=stop).df, df_group)
+    assert pgid_index.is_first_row.sum() == pgid_index.is_last_row.sum() == len(pgid_index)
+    assert (pgid_index.is_first_row == pgid_index.df["pgid"].ne(pgid_index.df["pgid"].shift(1)).to_numpy()).all()
+
+    # an already sorted df is not sorted again
+    assert PgidBoundaryIndex(df=pgid_index.df).df is pgid_index.df
+    assert len(PgidBoundaryIndex(df=df.iloc[:0])) == 0
+
+
+def test_pgid_boundary_index_select_split_and_headers():
+    df = TypedCsvParser(path=PATH_CSV_TEST_INPUT).read()
+    pgid_index = PgidBoundaryIndex(df=df)
+
+    # select and split derive the same index as building it again
+    mask_pgid = np.arange(len(pgid_index)) % 3 != 0
+    for _pgid_index in [pgid_index.select(mask_pgid=mask_pgid)] + pgid_index.split(nr_chunks=4):
+        pgid_index_expected = PgidBoundaryIndex(df=_pgid_index.df)
+        assert (_pgid_index.starts == pgid_index_expected.starts).all()
+        assert (_pgid_index.stops == pgid_index_expected.stops).all()
+        assert (_pgid_index.is_last_row == pgid_index_expected.is_last_row).all()
+        assert list(_pgid_index.pgids) == list(pgid_index_expected.pgids)
+    assert list(pgid_index.select(mask_pgid=mask_pgid).pgids) == list(pgid_index.pgids[mask_pgid])
+    pd.testing.assert_frame_equal(pd.concat([x.df for x in pgid_index.split(nr_chunks=4)]), pgid_index.df)
+
+    # the header values are those of the first row of each pgid
+    for (pgid, startdatum, einddatum), (_pgid, df_pgid) in zip(
+        pgid_index.iter_pgid_headers(), pgid_index.df.groupby("pgid", sort=True)
+    ):
+        assert (pgid, startdatum, einddatum) == (_pgid, df_pgid["startdatum"].iloc[0], df_pgid["einddatum"].iloc[0])
+        assert isinstance(startdatum, pd.Timestamp)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 1000])
+def test_pgid_boundary_index_row_chunks(chunk_size):
+    pgid_index = PgidBoundaryIndex(df=TypedCsvParser(path=PATH_CSV_TEST_INPUT).read())
+    chunks = list(pgid_index.iter_row_chunks(chunk_size=chunk_size))
+    pd.testing.assert_frame_equal(pd.concat([x.df for x in chunks]), pgid_index.df)
+    assert sum(len(x) for x in chunks) == len(pgid_index)
+    for chunk in chunks:
+        # whole pgids, and more than chunk_size rows only for a single pgid
+        assert chunk.is_first_row[0] and chunk.is_last_row[-1]
+        assert len(chunk.df) <= chunk_size or len(chunk) == 1
@@ -0,0 +1,55 @@
+from converter.constants import PATH_CSV_TEST_INPUT
+from converter.constants import PATH_CSV_TEST_INPUT_WITH_ERRORS
+from converter.staging import LocalStagingCopy
+
+import os
+import shutil
+
+
+def test_stage_copies_once_and_again_if_changed(tmp_path, monkeypatch):
+    source_path = tmp_path / "network_drive" / "export.csv"
+    source_path.parent.mkdir()
+    shutil.copy(PATH_CSV_TEST_INPUT, source_path)
+    staging = LocalStagingCopy(staging_dir=tmp_path / "staging", block_size=1024)
+
+    local_path = staging.stage(source_path=source_path)
+    assert local_path.parent == staging.staging_dir
+    assert local_path.read_bytes() == source_path.read_bytes()
+
+    # unchanged source: the local copy is used without copying
+    with monkeypatch.context() as patch:
+        patch.setattr(LocalStagingCopy, "_copy", lambda *args, **kwargs: None)
+        assert staging.stage(source_path=source_path) == local_path
+
+    # changed source (size and mtime): copied again
+    shutil.copy(PATH_CSV_TEST_INPUT_WITH_ERRORS, source_path)
+    os.utime(source_path, ns=(1, 1))
+    assert not staging.is_up_to_date(source_path=source_path)
+    assert staging.stage(source_path=source_path).read_bytes() == PATH_CSV_TEST_INPUT_WITH_ERRORS.read_bytes()
+    assert sorted(x.name for x in staging.staging_dir.iterdir()) == [local_path.name, f"{local_path.name}.json"]
+
+
+def test_stage_evicts_least_recently_used_copies(tmp_path):
+    source_dir = tmp_path / "network_drive"
+    source_dir.mkdir()
+    source_paths = [source_dir / f"Koppeling_AAP_{nr}.csv" for nr in range(3)]
+    for source_path in source_paths:
+        shutil.copy(PATH_CSV_TEST_INPUT, source_path)
+    size = source_paths[0].stat().st_size
+    staging = LocalStagingCopy(staging_dir=tmp_path / "staging", max_size_bytes=2 * size)
+
+    local_paths = [staging.stage(source_path=source_path) for source_path in source_paths[:2]]
+    os.utime(local_paths[0], ns=(1, 1))
+    os.utime(local_paths[1], ns=(2, 2))
+    staging.stage(source_path=source_paths[0])  # up to date: marks the copy as recently used
+
+    # the new copy does not fit: the least recently used copy (and its .json) is removed
+    local_paths.append(staging.stage(source_path=source_paths[2]))
+    assert sorted(x.name for x in staging.staging_dir.iterdir()) == sorted(
+        name for x in (local_paths[0], local_paths[2]) for name in (x.name, f"{x.name}.json")
+    )
+
+    # a copy that is larger than max_size_bytes is kept
+    staging.max_size_bytes = 1
+    assert staging.stage(source_path=source_paths[1]).is_file()
+    assert sorted(x.name for x in staging.staging_dir.iterdir()) == [local_paths[1].name, f"{local_paths[1].name}.json"]
@@ -0,0 +1,36 @@
+from converter.constants import PATH_CSV_TEST_INPUT
+from converter.constants import PATH_CSV_TEST_INPUT_WITH_ERRORS
+from converter.convert import ConvertCsvToXml
+from converter.streaming import StreamingConvertCsvToXml
+
+import pytest
+import random
+
+
+@pytest.mark.parametrize(
+    "orig_csv_path, chunk_size, block_size", [(PATH_CSV_TEST_INPUT, 500, 50), (PATH_CSV_TEST_INPUT_WITH_ERRORS, 7, 3)]
+)
+def test_streaming_equals_in_memory(tmp_path, orig_csv_path, chunk_size, block_size):
+    # shuffle the csv rows, so that the rows of a pgid are spread over the chunks
+    lines = orig_csv_path.read_text().splitlines()
+    rows = lines[1:]
+    random.Random(0).shuffle(rows)
+    csv_path = tmp_path / "shuffled.csv"
+    csv_path.write_text("\n".join([lines[0]] + rows) + "\n")
+
+    data_converter = ConvertCsvToXml(orig_csv_path=csv_path)
+    data_converter._outputdir = tmp_path / "in_memory"
+    data_converter._outputdir.mkdir()
+    data_converter.run()
+
+    # use small chunks and blocks to test the external sort
+    streaming_converter = StreamingConvertCsvToXml(orig_csv_path=csv_path, chunk_size=chunk_size, block_size=block_size)
+    streaming_converter._outputdir = tmp_path / "streaming"
+    streaming_converter._outputdir.mkdir()
+    streaming_converter.run()
+
+    in_memory_files = sorted(x.name for x in data_converter.output_dir.iterdir())
+    assert sorted(x.name for x in streaming_converter.output_dir.iterdir()) == in_memory_files
+    for file_name in in_memory_files:
+        expected_bytes = (data_converter.output_dir / file_name).read_bytes()
+        assert (streaming_converter.output_dir / file_name).read_bytes() == expected_bytes, file_name
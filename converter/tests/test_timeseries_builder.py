@@ -0,0 +1,34 @@
+from converter import timeseries_builder
+from datetime import datetime
+
+
+def test_get_series_long_validity_span():
+    ts_builder = timeseries_builder.PeilbesluitPeil(
+        eind_winter="01-04",
+        begin_zomer="01-05",
+        eind_zomer="01-09",
+        begin_winter="01-10",
+        pgid="PG0001",
+        startdatum=datetime(year=1990, month=1, day=1),
+        einddatum=datetime(year=2100, month=1, day=1),
+        zomerpeil=1.0,
+        winterpeil=0.5,
+    )
+    series_data = ts_builder.get_series(is_first_pgid_csv_row=True, is_last_pgid_csv_row=True)
+
+    # startdatum + 4 season dates for 1990-2099 + einddatum
+    assert len(series_data) == 1 + 4 * 110 + 1
+    assert series_data[0] == (datetime(year=1990, month=1, day=1), 0.5)
+    assert series_data[1:5] == [
+        (datetime(year=1990, month=4, day=1), 0.75),
+        (datetime(year=1990, month=5, day=1), 1.0),
+        (datetime(year=1990, month=9, day=1), 0.75),
+        (datetime(year=1990, month=10, day=1), 0.5),
+    ]
+    assert series_data[-1] == (datetime(year=2100, month=1, day=1), 0.5)
+    dates = [date for date, _ in series_data]
+    assert dates == sorted(set(dates))
+
+    # the last series is removed if another csv row of the same pgid follows
+    series_data_not_last_row = ts_builder.get_series(is_first_pgid_csv_row=True, is_last_pgid_csv_row=False)
+    assert series_data_not_last_row == series_data[:-1]
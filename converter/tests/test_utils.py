@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+from converter import utils
+from typing import List
+
+import json
+import os
+import pytest
+
+
+class _CountingDirEntry:
+    """Wraps an os.DirEntry (its methods can not be patched) and counts the stat() calls per name."""
+
+    def __init__(self, entry: os.DirEntry, stat_names: List[str]):
+        self._entry = entry
+        self._stat_names = stat_names
+        self.name = entry.name
+
+    def is_file(self) -> bool:
+        return self._entry.is_file()
+
+    def stat(self) -> os.stat_result:
+        self._stat_names.append(self.name)
+        return self._entry.stat()
+
+
+def test_get_last_gis_export_uses_index(tmp_path, monkeypatch):
+    stat_names = []
+    scandir = os.scandir
+
+    @contextmanager
+    def counting_scandir(path: str):
+        with scandir(path) as entries:
+            yield [_CountingDirEntry(entry=entry, stat_names=stat_names) for entry in entries]
+
+    monkeypatch.setattr(utils.os, "scandir", counting_scandir)
+
+    export_dir = tmp_path / "exports"
+    export_dir.mkdir()
+    index_path = tmp_path / "index.json"
+    for name in ("Koppeling_AAP_1.csv", "Koppeling_AAP_2.csv", "readme.txt"):
+        (export_dir / name).write_text("pgid")
+    os.utime(export_dir, ns=(1, 1))  # so that any later change of the export dir changes its mtime
+    ctime_2 = (export_dir / "Koppeling_AAP_2.csv").stat().st_ctime
+
+    # the first run stats each .csv
+    assert utils.get_last_gis_export_peilmarges_csv(export_dir=export_dir, index_path=index_path).name in {
+        "Koppeling_AAP_1.csv",
+        "Koppeling_AAP_2.csv",
+    }
+    assert sorted(stat_names) == ["Koppeling_AAP_1.csv", "Koppeling_AAP_2.csv"]
+    index = json.loads(index_path.read_text())
+    assert sorted(index[export_dir.as_posix()]["ctimes"]) == ["Koppeling_AAP_1.csv", "Koppeling_AAP_2.csv"]
+
+    # an unchanged export dir: no .csv is stat-ed, the ctimes come from the index
+    stat_names.clear()
+    index[export_dir.as_posix()]["ctimes"]["Koppeling_AAP_1.csv"] = ctime_2 + 100
+    index_path.write_text(json.dumps(index))
+    latest_path = utils.get_last_gis_export_peilmarges_csv(export_dir=export_dir, index_path=index_path)
+    assert latest_path == export_dir / "Koppeling_AAP_1.csv"
+    assert stat_names == []
+
+    # a recreated export (same name) changes the export dir, so it gets its ctime from the new file
+    (export_dir / "Koppeling_AAP_1.csv").unlink()
+    (export_dir / "Koppeling_AAP_1.csv").write_text("pgid;startdatum")
+    latest_path = utils.get_last_gis_export_peilmarges_csv(export_dir=export_dir, index_path=index_path)
+    assert latest_path == export_dir / "Koppeling_AAP_1.csv"
+    index = json.loads(index_path.read_text())
+    ctime_1 = (export_dir / "Koppeling_AAP_1.csv").stat().st_ctime
+    assert index[export_dir.as_posix()]["ctimes"]["Koppeling_AAP_1.csv"] == ctime_1
+
+    # new exports are stat-ed, removed exports are removed from the index
+    (export_dir / "Koppeling_AAP_1.csv").unlink()
+    (export_dir / "Koppeling_AAP_3.csv").write_text("pgid")
+    latest_path = utils.get_last_gis_export_peilmarges_csv(export_dir=export_dir, index_path=index_path)
+    assert latest_path == export_dir / "Koppeling_AAP_3.csv"
+    index = json.loads(index_path.read_text())
+    assert sorted(index[export_dir.as_posix()]["ctimes"]) == ["Koppeling_AAP_2.csv", "Koppeling_AAP_3.csv"]
+
+
+def test_atomic_write(tmp_path):
+    path = tmp_path / "index.json"
+    with utils.atomic_write(path=path) as tmp_path_:
+        tmp_path_.write_text("new")
+    assert path.read_text() == "new"
+
+    # on an exception the file is not changed and the temporary file is removed
+    with pytest.raises(ValueError):
+        with utils.atomic_write(path=path) as tmp_path_:
+            tmp_path_.write_text("half")
+            raise ValueError("interrupted")
+    assert path.read_text() == "new"
+    assert [x.name for x in tmp_path.iterdir()] == ["index.json"]
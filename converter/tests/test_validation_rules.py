@@ -0,0 +1,34 @@
+from converter.constants import PATH_CSV_TEST_INPUT
+from converter.csv_parser import TypedCsvParser
+from converter.error_store import CsvErrorStore
+from converter.validation_rules import ValidationRule
+from converter.validation_rules import ValidationRuleEngine
+
+import pytest
+
+
+def test_validation_rule_engine():
+    df = TypedCsvParser(path=PATH_CSV_TEST_INPUT).read()
+    rule_engine = ValidationRuleEngine()
+    rule = ValidationRule(
+        name="peil below zero",
+        level=ValidationRule.level_row,
+        message="zomerpeil < 0",
+        get_mask_error=lambda _df: _df["zomerpeil"] < 0,
+    )
+    rule_engine.add_rule(rule=rule)
+    with pytest.raises(AssertionError, match="already exists"):
+        rule_engine.add_rule(rule=rule)
+
+    error_store = CsvErrorStore()
+    rule_engine.evaluate(df=df, error_store=error_store, level=ValidationRule.level_row)
+    rule_engine.evaluate(df=df, error_store=error_store, level=ValidationRule.level_pgid)
+    mask_expected = (df["zomerpeil"] < 0).to_numpy()
+    assert mask_expected.any()
+    errors = error_store.get_error_column(index=df.index)
+    assert (errors.fillna("").str.contains("zomerpeil < 0").to_numpy() == mask_expected).all()
+
+    # each rule (the default rules and the added rule) is timed
+    assert list(rule_engine.seconds_per_rule) == [rule.name for rule in rule_engine.rules]
+    assert all(seconds > 0 for seconds in rule_engine.seconds_per_rule.values())
+    assert "check 6" in rule_engine.seconds_per_rule
@@ -1,4 +1,4 @@
-from converter.constants import DateFormats
+from converter.constants import get_month_day_day_of_year
 from datetime import datetime
 
 
@@ -7,10 +7,8 @@ class ConstantPeriod:
         self.start = start
         self.end = end
         self.level = level
-        self.start_month_int = datetime.strptime(start, DateFormats.dd_mm.value).month
-        self.start_day_int = datetime.strptime(start, DateFormats.dd_mm.value).day
-        self.end_month_int = datetime.strptime(end, DateFormats.dd_mm.value).month
-        self.end_day_int = datetime.strptime(end, DateFormats.dd_mm.value).day
+        self.start_month_int, self.start_day_int, self.start_day_of_year = get_month_day_day_of_year(start)
+        self.end_month_int, self.end_day_int, self.end_day_of_year = get_month_day_day_of_year(end)
 
     def __repr__(self):
         return f"start={self.start}, end={self.end}, level={self.level}"
@@ -54,7 +52,7 @@ class BuilderBase:
         starts = [x.start for x in self.periods]
         ends = [x.end for x in self.periods]
         assert len(starts) == len(set(starts)), f"{default_msg}: period startdates {starts} must be unique"
-        assert len(starts) == len(set(starts)), f"{default_msg}: period enddates {ends} must be unique"
+        assert len(ends) == len(set(ends)), f"{default_msg}: period enddates {ends} must be unique"
         first_start = starts[0]
         last_end = None
         previous_end = None
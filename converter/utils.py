@@ -1,11 +1,15 @@
+from contextlib import contextmanager
+from converter.constants import EXPORT_INDEX_PATH
 from converter.constants import PEILMARGE_GIS_EXPORT_DIR
 from pathlib import Path
+from typing import Dict
+from typing import Iterator
 
-import glob
+import fnmatch
+import hashlib
+import json
 import logging
-import numpy as np  # noqa numpy comes with geopandas
 import os
-import pandas as pd  # noqa pandas comes with geopandas
 
 
 logger = logging.getLogger(__name__)
@@ -16,10 +20,77 @@ def get_progress(iteration_nr: int, nr_to_do: int):
     return progress_percentage
 
 
-def get_last_gis_export_peilmarges_csv() -> Path:
-    list_of_files = glob.glob(pathname=(PEILMARGE_GIS_EXPORT_DIR / "*.csv").as_posix())  # noqa
-    assert list_of_files, f"could not find any gis export. We expected at =>1 .csv files in {PEILMARGE_GIS_EXPORT_DIR}"
-    latest_file = max(list_of_files, key=os.path.getctime)
-    latest_file_path = Path(latest_file)
+def get_file_hash(path: Path, block_size: int = 1024 * 1024) -> str:
+    """The sha256 (hex) of the content of a file, read in blocks of block_size bytes."""
+    file_hash = hashlib.sha256()
+    with open(path.as_posix(), mode="rb") as _file:
+        for block in iter(lambda: _file.read(block_size), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+@contextmanager
+def atomic_write(path: Path) -> Iterator[Path]:
+    """
+    Yield a temporary path next to path to write to. On success it is renamed to path (atomic, so readers never see
+    a half written file), on an exception it is removed.
+    """
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    try:
+        yield tmp_path
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path.as_posix(), path.as_posix())
+
+
+def _read_export_index(index_path: Path) -> Dict[str, dict]:
+    """
+    The {export dir: {dir_mtime_ns, ctimes: {csv name: ctime}}} of the export dirs seen before (empty if there is no
+    index or it is corrupt).
+    """
+    if not index_path.is_file():
+        return {}
+    try:
+        index = json.loads(index_path.read_text())
+    except ValueError as err:
+        logger.warning(f"ignoring corrupt export index {index_path}, err={err}")
+        return {}
+    return index if isinstance(index, dict) else {}
+
+
+def _write_export_index(index_path: Path, index: Dict[str, dict]) -> None:
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(path=index_path) as tmp_path:
+        tmp_path.write_text(json.dumps(index, indent=4))
+
+
+def get_last_gis_export_peilmarges_csv(
+    export_dir: Path = PEILMARGE_GIS_EXPORT_DIR, index_path: Path = EXPORT_INDEX_PATH
+) -> Path:
+    """
+    The .csv in export_dir with the latest ctime. The directory is listed in one os.scandir pass. The ctime of each
+    .csv is kept in a persistent index (index_path), so a .csv in the index is not stat-ed again: only the export dir
+    itself is stat-ed. Creating, removing or replacing a file changes the mtime of the export dir, so then all .csv
+    are stat-ed once (a full rescan), and a .csv that is recreated under the same name gets its new ctime.
+    """
+    index = _read_export_index(index_path=index_path)
+    dir_mtime_ns = export_dir.stat().st_mtime_ns  # before listing, so a change while listing causes a rescan
+    known_dir = index.get(export_dir.as_posix())
+    is_dir_unchanged = isinstance(known_dir, dict) and known_dir.get("dir_mtime_ns") == dir_mtime_ns
+    known_ctimes = known_dir.get("ctimes", {}) if is_dir_unchanged else {}
+    ctimes = {}
+    with os.scandir(export_dir.as_posix()) as entries:
+        for entry in entries:
+            if not fnmatch.fnmatch(entry.name, "*.csv") or not entry.is_file():
+                continue
+            is_known = entry.name in known_ctimes
+            ctimes[entry.name] = known_ctimes[entry.name] if is_known else entry.stat().st_ctime
+    assert ctimes, f"could not find any gis export. We expected at =>1 .csv files in {export_dir}"
+    if not is_dir_unchanged or ctimes != known_ctimes:
+        # also removes the exports that no longer exist
+        index[export_dir.as_posix()] = {"dir_mtime_ns": dir_mtime_ns, "ctimes": ctimes}
+        _write_export_index(index_path=index_path, index=index)
+    latest_file_path = export_dir / max(ctimes, key=ctimes.get)
     assert latest_file_path.is_file()
     return latest_file_path
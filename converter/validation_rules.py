@@ -0,0 +1,256 @@
+from converter import constants
+from converter.constants import ColumnNameDtypeConstants
+from converter.csv_parser import TypedCsvParser
+from converter.error_store import CsvErrorStore
+from converter.pgid_index import PgidBoundaryIndex
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import logging
+import pandas as pd
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class ValidationRule:
+    """
+    One validation rule, declared once with its message and a function that computes its error mask over all rows
+    at once (vectorized, no row loop):
+        - level 'row': get_mask_error(df) is evaluated per row, so on any subset of rows
+        - level 'pgid': get_mask_error(pgid_index) needs all rows of each pgid (sorted by pgid and startdatum, see
+          PgidBoundaryIndex), e.g. for rules that compare subsequent rows of a pgid
+    With get_details the message is a template that is rendered per row (see CsvErrorStore.add).
+    """
+
+    level_row = "row"
+    level_pgid = "pgid"
+
+    def __init__(
+        self,
+        name: str,
+        level: str,
+        message: str,
+        get_mask_error: Callable[..., pd.Series],
+        get_details: Callable[..., Dict[str, pd.Series]] = None,
+    ):
+        assert level in (self.level_row, self.level_pgid), f"level must be 'row' or 'pgid', but found {level}"
+        self.name = name
+        self.level = level
+        self.message = message
+        self.get_mask_error = get_mask_error
+        self.get_details = get_details
+
+
+def _get_mask_not_chained(cols: List[str], _min: float, _max: float) -> Callable[[pd.DataFrame], pd.Series]:
+    """The mask of rows where not _min <= cols[0] <= cols[1] <= .. <= _max (also where a cell is NaN or NA)."""
+
+    def get_mask_error(df: pd.DataFrame) -> pd.Series:
+        mask_ok = _min <= df[cols[0]]
+        for col, next_col in zip(cols[:-1], cols[1:]):
+            mask_ok &= df[col] <= df[next_col]
+        return ~(mask_ok & (df[cols[-1]] <= _max)).fillna(False)
+
+    return get_mask_error
+
+
+def _get_day_of_year(df: pd.DataFrame, col: str) -> pd.Series:
+    """The day_of_year of the dd-mm strings in col (NaN if empty or not a valid dd-mm)."""
+    return df[col].map(constants.get_dd_mm_day_of_year()).astype(float)
+
+
+def _get_mask_not_ordered(cols: List[str]) -> Callable[[pd.DataFrame], pd.Series]:
+    """The mask of rows where all dd-mm in cols are valid, but not cols[0] < cols[1] < .. (as day_of_year)."""
+
+    def get_mask_error(df: pd.DataFrame) -> pd.Series:
+        days_of_year = [_get_day_of_year(df=df, col=col) for col in cols]
+        mask_ok = pd.Series(True, index=df.index)
+        for day_of_year, next_day_of_year in zip(days_of_year[:-1], days_of_year[1:]):
+            mask_ok &= day_of_year < next_day_of_year
+        mask_valid = pd.concat(days_of_year, axis=1).notna().all(axis=1)
+        return mask_valid & ~mask_ok
+
+    return get_mask_error
+
+
+def _get_mask_not_connected(pgid_index: PgidBoundaryIndex) -> pd.Series:
+    df = pgid_index.df
+    is_same_pgid = pd.Series(~pgid_index.is_first_row, index=df.index)
+    return is_same_pgid & (df[ColumnNameDtypeConstants.col_startdatum] != _get_previous_end(df=df))
+
+
+def _get_previous_end(df: pd.DataFrame) -> pd.Series:
+    return df[ColumnNameDtypeConstants.col_einddatum].shift(1)
+
+
+class ValidationRuleEngine(ColumnNameDtypeConstants):
+    """
+    Registry of validation rules (default: get_default_rules). evaluate() adds the errors of all rules of one level
+    to a CsvErrorStore, and measures the evaluation time of each rule (summed over all evaluate calls, e.g. all
+    batches in streaming mode), so that a slow rule is visible in the log (see log_timings).
+    """
+
+    def __init__(self, rules: List[ValidationRule] = None):
+        self.rules: List[ValidationRule] = []
+        self.seconds_per_rule: Dict[str, float] = {}
+        for rule in self.get_default_rules() if rules is None else rules:
+            self.add_rule(rule=rule)
+
+    @classmethod
+    def get_default_rules(cls, with_season_date_rules: bool = False) -> List[ValidationRule]:
+        """
+        The rules of ConvertCsvToXml.validate_df (check 0 and 2 to 6), in the order of the error messages per row.
+        With with_season_date_rules=True check 1 is a rule too (see get_season_date_rules), instead of a check that
+        raises for the first row with an error (see ConvertCsvToXml._check_season_dates_are_ordered).
+        """
+        row = ValidationRule.level_row
+        rules = []
+
+        # check 0: cells that are empty or could not be converted to the dtype map (see TypedCsvParser)
+        for col in cls.all_cols:
+            rules.append(
+                ValidationRule(
+                    name=f"check 0 {col}",
+                    level=row,
+                    message=f"{col} is empty or is not {TypedCsvParser.get_dtype_description(col=col)}",
+                    get_mask_error=lambda df, _col=col: df[_col].isna(),
+                )
+            )
+
+        if with_season_date_rules:
+            rules.extend(cls.get_season_date_rules())
+
+        # check 2: validate onder marges per row
+        _min = constants.MIN_ALLOW_LOWER_MARGIN_CM
+        _max = constants.MAX_ALLOW_LOWER_MARGIN_CM
+        cols = [cls.col_1e_marge_onder, cls.col_2e_marge_onder]
+        rules.append(
+            ValidationRule(
+                name="check 2",
+                level=row,
+                message=f"invalid onder marges as we expected {_min} <= _1e_marge_onder <= _2e_marge_onder <= {_max}",
+                get_mask_error=_get_mask_not_chained(cols=cols, _min=_min, _max=_max),
+            )
+        )
+
+        # check 3: validate boven marges per row
+        _min = constants.MIN_ALLOW_UPPER_MARGIN_CM
+        _max = constants.MAX_ALLOW_UPPER_MARGIN_CM
+        cols = [cls.col_1e_marge_boven, cls.col_2e_marge_boven]
+        rules.append(
+            ValidationRule(
+                name="check 3",
+                level=row,
+                message=f"invalid boven marges as we expected {_min} <= _1e_marge_boven <= _2e_marge_boven <= {_max}",
+                get_mask_error=_get_mask_not_chained(cols=cols, _min=_min, _max=_max),
+            )
+        )
+
+        # check 4: check peilen
+        _min = constants.MIN_ALLOWED_MNAP
+        _max = constants.MAX_ALLOWED_MNAP
+        for col in (cls.col_zomerpeil, cls.col_winterpeil):
+            rules.append(
+                ValidationRule(
+                    name=f"check 4 {col}",
+                    level=row,
+                    message=f"invalid {col} as we expected {_min} <= {col} <= {_max}",
+                    get_mask_error=lambda df, _col=col, _min=_min, _max=_max: ~df[_col].between(_min, _max),
+                )
+            )
+
+        # check 5: col_startdatum < col_einddatum
+        rules.append(
+            ValidationRule(
+                name="check 5",
+                level=row,
+                message="start < einddatum",
+                get_mask_error=lambda df: df[cls.col_startdatum] >= df[cls.col_einddatum],
+            )
+        )
+
+        # check 6: subsequent rows of the same pgid must connect (no gap, and no overlap)
+        default_msg = "subsequent rows of the same pgid must connect (no gap, and no overlap)"
+        rules.append(
+            ValidationRule(
+                name="check 6",
+                level=ValidationRule.level_pgid,
+                message=(
+                    f"{default_msg}: {cls.col_pgid}={{pgid}}, row={{row}}, {cls.col_startdatum}={{startdatum}}, "
+                    f"previous_end={{previous_end}}"
+                ),
+                get_mask_error=_get_mask_not_connected,
+                get_details=lambda pgid_index: {
+                    "pgid": pgid_index.df[cls.col_pgid],
+                    "startdatum": pgid_index.df[cls.col_startdatum],
+                    "previous_end": _get_previous_end(df=pgid_index.df),
+                },
+            )
+        )
+        return rules
+
+    @classmethod
+    def get_season_date_rules(cls) -> List[ValidationRule]:
+        """
+        Check 1 as row rules: a dd-mm that is not valid (empty cells are reported by check 0), and dates that are not
+        ordered (eind_winter < begin_zomer < eind_zomer < begin_winter). The latter only if all 4 dd-mm are valid.
+        """
+        season_cols = [cls.col_eind_winter, cls.col_begin_zomer, cls.col_eind_zomer, cls.col_begin_winter]
+        rules = [
+            ValidationRule(
+                name=f"check 1 {col}",
+                level=ValidationRule.level_row,
+                message=f"{col} is not a valid dd-mm date (e.g. 01-04 is April 1)",
+                get_mask_error=lambda df, _col=col: df[_col].notna() & _get_day_of_year(df=df, col=_col).isna(),
+            )
+            for col in season_cols
+        ]
+        rules.append(
+            ValidationRule(
+                name="check 1",
+                level=ValidationRule.level_row,
+                message=f"dates are not ordered as we expected {' < '.join(season_cols)}",
+                get_mask_error=_get_mask_not_ordered(cols=season_cols),
+            )
+        )
+        return rules
+
+    def add_rule(self, rule: ValidationRule) -> None:
+        assert rule.name not in self.seconds_per_rule, f"rule {rule.name} already exists"
+        self.rules.append(rule)
+        self.seconds_per_rule[rule.name] = 0.0
+
+    def evaluate(
+        self, df: pd.DataFrame, error_store: CsvErrorStore, level: str, pgid_index: Optional[PgidBoundaryIndex] = None
+    ) -> None:
+        """
+        Evaluate the rules of level on df. For level 'pgid' df must contain all rows of each pgid in df. Rows without
+        pgid are skipped and df is not sorted again if it is already sorted by (pgid, startdatum). pgid_index (the
+        index of df, if it is already built) is used for level 'pgid' instead of building it again.
+        """
+        rules = [rule for rule in self.rules if rule.level == level]
+        if not rules:
+            return
+        data = df
+        if level == ValidationRule.level_pgid:
+            if pgid_index is None:
+                data = PgidBoundaryIndex(df=df[df[self.col_pgid].notna()])
+            else:
+                mask_pgid = pd.notna(pgid_index.pgids)
+                data = pgid_index if mask_pgid.all() else pgid_index.select(mask_pgid=mask_pgid)
+        for rule in rules:
+            start = time.perf_counter()
+            mask_error = rule.get_mask_error(data)
+            details = rule.get_details(data) if rule.get_details else None
+            error_store.add(rule=rule.name, mask_error=mask_error, message=rule.message, details=details)
+            self.seconds_per_rule[rule.name] += time.perf_counter() - start
+
+    def log_timings(self) -> None:
+        total_seconds = sum(self.seconds_per_rule.values())
+        logger.info(f"evaluated {len(self.rules)} validation rules in {total_seconds:.3f}s")
+        for name, seconds in sorted(self.seconds_per_rule.items(), key=lambda x: x[1], reverse=True):
+            share = seconds / total_seconds if total_seconds else 0
+            logger.info(f"validation rule '{name}': {seconds:.3f}s ({share:.0%})")
@@ -1,13 +1,75 @@
 from converter import constants
-from converter import timeseries_builder
 from converter.constants import ColumnNameDtypeConstants
 from converter.constants import TAB
 from converter.constants import XmlConstants
 from datetime import datetime
-
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import logging
+import numpy as np
 import pandas as pd
 
 
+logger = logging.getLogger(__name__)
+
+
+# max nr of cached date strings and level strings (lru_cache evicts the least recently used)
+DATE_STRING_CACHE_SIZE = 1024 * 16
+LEVEL_STRING_CACHE_SIZE = 1024 * 64
+
+
+@lru_cache(maxsize=DATE_STRING_CACHE_SIZE)
+def _get_xml_datestring_cached(value) -> str:
+    datetime_obj = None
+    if isinstance(value, str):
+        try:
+            datetime_obj = datetime.strptime(value, constants.DateFormats.yyyymmdd.value)
+        except Exception:  # noqa
+            datetime_obj = datetime.strptime(value, constants.DateFormats.yyyy_mm_dd.value)
+    elif isinstance(value, datetime):
+        datetime_obj = value
+    return datetime_obj.strftime(constants.DateFormats.yyyy_mm_dd.value)
+
+
+@lru_cache(maxsize=LEVEL_STRING_CACHE_SIZE)
+def _get_level_string_cached(level: float) -> str:
+    return f"{level:.2f}"  # ensure two decimals
+
+
+def get_level_string(level: float) -> str:
+    if level == 0:
+        # 0.0 and -0.0 are equal (so same cache key), but they are formatted differently ('0.00' and '-0.00')
+        return f"{level:.2f}"
+    return _get_level_string_cached(level)
+
+
+def _create_header_template(timeseries_constants) -> str:
+    """Everything in a series header is fixed per parameter, except for pgid, startdate_str and enddate_str."""
+    return (
+        f"{TAB*1}<series>\n"
+        f"{TAB*2}<header>\n"
+        f"{TAB*3}<type>instantaneous</type>\n"
+        f"{TAB*3}<locationId>{{pgid}}</locationId>\n"
+        f"{TAB*3}<parameterId>{timeseries_constants.parameter_id}</parameterId>\n"
+        f'{TAB*3}<timeStep unit="nonequidistant"/>\n'
+        f'{TAB*3}<startDate date="{{startdate_str}}" time="00:00:00"></startDate>\n'
+        f'{TAB*3}<endDate date="{{enddate_str}}" time="00:00:00"></endDate>\n'
+        f"{TAB*3}<missVal>-999.99</missVal>\n"
+        f"{TAB*3}<longName>{timeseries_constants.longname}</longName>\n"
+        f"{TAB*3}<units>{timeseries_constants.units}</units>\n"
+        f"{TAB*3}<sourceOrganisation></sourceOrganisation>\n"
+        f"{TAB*3}<sourceSystem>tijdreeks FEWS-PI.xls</sourceSystem>\n"
+        f"{TAB*3}<fileDescription></fileDescription>\n"
+        f"{TAB*3}<region></region>\n"
+        f"{TAB*2}</header>\n"
+    )
+
+
 class XmlSeriesBuilder(ColumnNameDtypeConstants):
     """
     Below the first three rows of the input csv are shown:
@@ -36,23 +98,24 @@ class XmlSeriesBuilder(ColumnNameDtypeConstants):
     We see the xml result of the first csv two rows (the share the same pgid):
     """
 
-    def __init__(self, xml_file, is_first_pgid_csv_row: bool, is_last_pgid_csv_row: bool, df_pgid_row: pd.Series):
+    # order of the 5 series of one pgid in the xml
+    series_constants = (
+        XmlConstants.peilbesluitpeil,
+        XmlConstants.eerste_ondergrens,
+        XmlConstants.tweede_ondergrens,
+        XmlConstants.eerste_bovengrens,
+        XmlConstants.tweede_bovengrens,
+    )
+
+    # precompiled header per parameter_id
+    header_templates = {x.parameter_id: _create_header_template(timeseries_constants=x) for x in series_constants}
+
+    def __init__(self, xml_file, pgid: str, startdatum: pd.Timestamp, einddatum: pd.Timestamp):
+        """The header values of one pgid: startdatum and einddatum of its first csv row (see iter_pgid_headers)."""
         self.xml_file = xml_file
-        self.is_first_pgid_csv_row = is_first_pgid_csv_row
-        self.is_last_pgid_csv_row = is_last_pgid_csv_row
-        self.pgid = str(df_pgid_row[self.col_pgid])
-        self.startdatum = df_pgid_row[self.col_startdatum]
-        self.einddatum = df_pgid_row[self.col_einddatum]
-        self.eind_winter = str(df_pgid_row[self.col_eind_winter])
-        self.begin_zomer = str(df_pgid_row[self.col_begin_zomer])
-        self.eind_zomer = str(df_pgid_row[self.col_eind_zomer])
-        self.begin_winter = str(df_pgid_row[self.col_begin_winter])
-        self.zomerpeil = float(df_pgid_row[self.col_zomerpeil])
-        self.winterpeil = float(df_pgid_row[self.col_winterpeil])
-        self._2e_marge_onder = float(df_pgid_row[self.col_2e_marge_onder])
-        self._1e_marge_onder = float(df_pgid_row[self.col_1e_marge_onder])
-        self._1e_marge_boven = float(df_pgid_row[self.col_1e_marge_boven])
-        self._2e_marge_boven = float(df_pgid_row[self.col_2e_marge_boven])
+        self.pgid = str(pgid)
+        self.startdatum = startdatum
+        self.einddatum = einddatum
 
     @staticmethod
     def add_xml_series(xml_file):
@@ -60,201 +123,156 @@ class XmlSeriesBuilder(ColumnNameDtypeConstants):
 
     @staticmethod
     def get_xml_datestring(value) -> str:
-        datetime_obj = None
-        if isinstance(value, str):
-            try:
-                datetime_obj = datetime.strptime(value, constants.DateFormats.yyyymmdd.value)
-            except Exception:  # noqa
-                datetime_obj = datetime.strptime(value, constants.DateFormats.yyyy_mm_dd.value)
-        elif isinstance(value, datetime):
-            datetime_obj = value
-        return datetime_obj.strftime(constants.DateFormats.yyyy_mm_dd.value)
-
-    def add_end_of_events(self):
-        self.xml_file.write(f"{TAB}</series>\n")  # noqa
-
-    def add_header(self, timeseries_constants):
-        startdate_str = self.get_xml_datestring(value=self.startdatum)
-        enddate_str = self.get_xml_datestring(value=self.einddatum)
-        self.xml_file.write(f"{TAB*1}<series>\n")
-        self.xml_file.write(f"{TAB*2}<header>\n")
-        self.xml_file.write(f"{TAB*3}<type>instantaneous</type>\n")
-        self.xml_file.write(f"{TAB*3}<locationId>{self.pgid}</locationId>\n")
-        self.xml_file.write(f"{TAB*3}<parameterId>{timeseries_constants.parameter_id}</parameterId>\n")
-        self.xml_file.write(f'{TAB*3}<timeStep unit="nonequidistant"/>\n')
-        self.xml_file.write(f'{TAB*3}<startDate date="{startdate_str}" time="00:00:00"></startDate>\n')
-        self.xml_file.write(f'{TAB*3}<endDate date="{enddate_str}" time="00:00:00"></endDate>\n')
-        self.xml_file.write(f"{TAB*3}<missVal>-999.99</missVal>\n")
-        self.xml_file.write(f"{TAB*3}<longName>{timeseries_constants.longname}</longName>\n")
-        self.xml_file.write(f"{TAB*3}<units>{timeseries_constants.units}</units>\n")
-        self.xml_file.write(f"{TAB*3}<sourceOrganisation></sourceOrganisation>\n")
-        self.xml_file.write(f"{TAB*3}<sourceSystem>tijdreeks FEWS-PI.xls</sourceSystem>\n")
-        self.xml_file.write(f"{TAB*3}<fileDescription></fileDescription>\n")
-        self.xml_file.write(f"{TAB*3}<region></region>\n")
-        self.xml_file.write(f"{TAB*2}</header>\n")
-
-    def add_series_peilbesluitpeil(self):
-        timeseries_constants = XmlConstants.peilbesluitpeil
-        if self.is_first_pgid_csv_row:
-            self.add_header(timeseries_constants=timeseries_constants)
-
-        ts_builder = timeseries_builder.PeilbesluitPeil(
-            # baseclass arguments
-            pgid=self.pgid,
-            startdatum=self.startdatum,
-            einddatum=self.einddatum,
-            zomerpeil=self.zomerpeil,
-            winterpeil=self.winterpeil,
-            # subclass arguments
-            eind_winter=self.eind_winter,
-            begin_zomer=self.begin_zomer,
-            eind_zomer=self.eind_zomer,
-            begin_winter=self.begin_winter,
-        )
-        series_data = ts_builder.get_series(
-            is_first_pgid_csv_row=self.is_first_pgid_csv_row, is_last_pgid_csv_row=self.is_last_pgid_csv_row
-        )
-        for series in series_data:
-            date, level = series
-            date_string = date.strftime(constants.DateFormats.yyyy_mm_dd.value)
-            level_str = f"{level:.2f}"  # ensure two decimals
-            xml_line = f'{TAB*2}<event date="{date_string}" time="00:00:00" value="{level_str}" flag="0"/>\n'
-            self.xml_file.write(xml_line)
-
-        if self.is_last_pgid_csv_row:
-            self.add_end_of_events()
-
-        return self.xml_file
-
-    def add_series_eerste_ondergrens(self):
-        timeseries_constants = XmlConstants.eerste_ondergrens
-
-        if self.is_first_pgid_csv_row:
-            self.add_header(timeseries_constants=timeseries_constants)
-
-        ts_builder = timeseries_builder.Ondergrens(
-            # baseclass arguments
-            pgid=self.pgid,
-            startdatum=self.startdatum,
-            einddatum=self.einddatum,
-            zomerpeil=self.zomerpeil,
-            winterpeil=self.winterpeil,
-            # subclass arguments
-            begin_zomer=self.begin_zomer,
-            eind_zomer=self.eind_zomer,
-            marge=self._1e_marge_onder,
-        )
-        series_data = ts_builder.get_series(
-            is_first_pgid_csv_row=self.is_first_pgid_csv_row, is_last_pgid_csv_row=self.is_last_pgid_csv_row
-        )
-        for series in series_data:
-            date, level = series
-            date_string = date.strftime(constants.DateFormats.yyyy_mm_dd.value)
-            level_str = f"{level:.2f}"  # ensure two decimals
-            xml_line = f'{TAB*2}<event date="{date_string}" time="00:00:00" value="{level_str}" flag="0"/>\n'
-            self.xml_file.write(xml_line)
-
-        if self.is_last_pgid_csv_row:
-            self.add_end_of_events()
-
-        return self.xml_file
-
-    def add_series_tweede_ondergrens(self):
-        timeseries_constants = XmlConstants.tweede_ondergrens
-
-        if self.is_first_pgid_csv_row:
-            self.add_header(timeseries_constants=timeseries_constants)
-
-        ts_builder = timeseries_builder.Ondergrens(
-            # baseclass arguments
-            pgid=self.pgid,
-            startdatum=self.startdatum,
-            einddatum=self.einddatum,
-            zomerpeil=self.zomerpeil,
-            winterpeil=self.winterpeil,
-            # subclass arguments
-            begin_zomer=self.begin_zomer,
-            eind_zomer=self.eind_zomer,
-            marge=self._2e_marge_onder,
-        )
-        series_data = ts_builder.get_series(
-            is_first_pgid_csv_row=self.is_first_pgid_csv_row, is_last_pgid_csv_row=self.is_last_pgid_csv_row
-        )
-        for series in series_data:
-            date, level = series
-            date_string = date.strftime(constants.DateFormats.yyyy_mm_dd.value)
-            level_str = f"{level:.2f}"  # ensure two decimals
-            xml_line = f'{TAB*2}<event date="{date_string}" time="00:00:00" value="{level_str}" flag="0"/>\n'
-            self.xml_file.write(xml_line)
-
-        if self.is_last_pgid_csv_row:
-            self.add_end_of_events()
+        return _get_xml_datestring_cached(value)
 
-        return self.xml_file
+    @staticmethod
+    def get_cache_info() -> Dict[str, dict]:
+        """Hit/miss counters of the date string and level string caches."""
+        return {
+            name: cache_info._asdict()
+            for name, cache_info in (
+                ("date_string", _get_xml_datestring_cached.cache_info()),
+                ("level_string", _get_level_string_cached.cache_info()),
+            )
+        }
 
-    def add_series_eerste_bovengrens(self):
-        timeseries_constants = XmlConstants.eerste_bovengrens
+    @staticmethod
+    def get_end_of_events() -> str:
+        return f"{TAB}</series>\n"
 
-        if self.is_first_pgid_csv_row:
-            self.add_header(timeseries_constants=timeseries_constants)
+    def add_end_of_events(self):
+        self.xml_file.write(self.get_end_of_events())  # noqa
 
-        ts_builder = timeseries_builder.Bovengrens(
-            # baseclass arguments
+    def get_header(self, timeseries_constants) -> str:
+        header_template = self.header_templates.get(timeseries_constants.parameter_id)
+        if header_template is None:
+            header_template = _create_header_template(timeseries_constants=timeseries_constants)
+        return header_template.format(
             pgid=self.pgid,
-            startdatum=self.startdatum,
-            einddatum=self.einddatum,
-            zomerpeil=self.zomerpeil,
-            winterpeil=self.winterpeil,
-            # subclass arguments
-            eind_winter=self.eind_winter,
-            begin_winter=self.begin_winter,
-            marge=self._1e_marge_boven,
+            startdate_str=self.get_xml_datestring(value=self.startdatum),
+            enddate_str=self.get_xml_datestring(value=self.einddatum),
         )
-        series_data = ts_builder.get_series(
-            is_first_pgid_csv_row=self.is_first_pgid_csv_row, is_last_pgid_csv_row=self.is_last_pgid_csv_row
-        )
-
-        for series in series_data:
-            date, level = series
-            date_string = date.strftime(constants.DateFormats.yyyy_mm_dd.value)
-            level_str = f"{level:.2f}"  # ensure two decimals
-            xml_line = f'{TAB*2}<event date="{date_string}" time="00:00:00" value="{level_str}" flag="0"/>\n'
-            self.xml_file.write(xml_line)
-
-        if self.is_last_pgid_csv_row:
-            self.add_end_of_events()
-
-        return self.xml_file
 
-    def add_series_tweede_bovengrens(self):
-        timeseries_constants = XmlConstants.tweede_bovengrens
-
-        if self.is_first_pgid_csv_row:
-            self.add_header(timeseries_constants=timeseries_constants)
+    def add_header(self, timeseries_constants):
+        self.xml_file.write(self.get_header(timeseries_constants=timeseries_constants))
 
-        ts_builder = timeseries_builder.Bovengrens(
-            # baseclass arguments
-            pgid=self.pgid,
-            startdatum=self.startdatum,
-            einddatum=self.einddatum,
-            zomerpeil=self.zomerpeil,
-            winterpeil=self.winterpeil,
-            # subclass arguments
-            eind_winter=self.eind_winter,
-            begin_winter=self.begin_winter,
-            marge=self._2e_marge_boven,
-        )
-        series_data = ts_builder.get_series(
-            is_first_pgid_csv_row=self.is_first_pgid_csv_row, is_last_pgid_csv_row=self.is_last_pgid_csv_row
-        )
-        for series in series_data:
-            date, level = series
-            date_string = date.strftime(constants.DateFormats.yyyy_mm_dd.value)
-            level_str = f"{level:.2f}"  # ensure two decimals
-            xml_line = f'{TAB*2}<event date="{date_string}" time="00:00:00" value="{level_str}" flag="0"/>\n'
-            self.xml_file.write(xml_line)
+    @staticmethod
+    def render_events(dates: np.ndarray, levels: np.ndarray) -> str:
+        """
+        Render all <event .../> lines of one series in one batch. Dates are converted with numpy datetime_as_string
+        and only the unique levels are formatted (with two decimals and cached), so no strftime or format per event.
+        """
+        date_strings = np.datetime_as_string(dates.astype("datetime64[D]"), unit="D")
+        # unique on the float bits so that e.g. -0.0 ('-0.00') and 0.0 ('0.00') are formatted separately
+        unique_level_bits, inverse = np.unique(levels.astype(np.float64).view(np.int64), return_inverse=True)
+        unique_level_strings = np.array([get_level_string(level) for level in unique_level_bits.view(np.float64)])
+        level_strings = unique_level_strings[inverse.reshape(-1)]
+        lines = np.char.add(f'{TAB*2}<event date="', date_strings)
+        lines = np.char.add(lines, '" time="00:00:00" value="')
+        lines = np.char.add(lines, level_strings)
+        lines = np.char.add(lines, '" flag="0"/>\n')
+        return "".join(lines.tolist())
+
+    def get_all_series_xml(self, all_series_events: List[Tuple[np.ndarray, np.ndarray]]) -> str:
+        """
+        Get the 5 xml series (each with a header) of this pgid as one xml fragment. all_series_events has the
+        (dates, levels) of each series (see event_table.EventTableBuilder.iter_pgid_series).
+        """
+        assert len(all_series_events) == len(self.series_constants)
+        series_blocks = []
+        for timeseries_constants, (dates, levels) in zip(self.series_constants, all_series_events):
+            series_blocks.append(self.get_header(timeseries_constants=timeseries_constants))
+            series_blocks.append(self.render_events(dates=dates, levels=levels))
+            series_blocks.append(self.get_end_of_events())
+        return "".join(series_blocks)
+
+
+class XmlFileWriter:
+    """
+    Write the xml in binary mode and utf-8 (the encoding in the xml declaration) instead of the platform's default
+    encoding. Written text is collected and written to disk in chunks of >= buffer_size bytes, so only a few large
+    writes are needed (which matters a lot on a network share). Newlines are always '\\n'.
+    """
 
-        if self.is_last_pgid_csv_row:
-            self.add_end_of_events()
+    encoding = "utf-8"
+
+    def __init__(self, path: Path, buffer_size: int = constants.XML_WRITE_BUFFER_SIZE):
+        assert buffer_size > 0
+        self.path = path
+        self.buffer_size = buffer_size
+        self._file = open(path.as_posix(), mode="wb", buffering=buffer_size)
+        self._buffer = []
+        self._buffer_nr_bytes = 0
+        self.nr_bytes_written = 0
+        self.nr_flushes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, text: str) -> None:
+        self.write_bytes(data=text.encode(self.encoding))
+
+    def write_bytes(self, data: bytes) -> None:
+        """Write text that is already encoded with self.encoding."""
+        self._buffer.append(data)
+        self._buffer_nr_bytes += len(data)
+        if self._buffer_nr_bytes >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        self._file.write(b"".join(self._buffer))
+        self._file.flush()
+        self.nr_bytes_written += self._buffer_nr_bytes
+        self.nr_flushes += 1
+        self._buffer = []
+        self._buffer_nr_bytes = 0
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+        logger.info(f"written {self.nr_bytes_written} bytes in {self.nr_flushes} flushes to {self.path}")
+
+
+class XmlFragmentTee:
+    """
+    Fan-out writer: each xml fragment is rendered (and encoded) once and written to all sinks that still accept
+    fragments, e.g. the large xml and the small test sample xml. A sink can be limited to the first
+    max_nr_fragments fragments. Text written with write() (e.g. the first and last xml rows) goes to all sinks.
+    """
 
-        return self.xml_file
+    def __init__(self):
+        self.sinks: List[Tuple[XmlFileWriter, Optional[int]]] = []
+        self.nr_fragments = 0
+
+    def add_sink(self, xml_file: XmlFileWriter, max_nr_fragments: Optional[int] = None) -> None:
+        assert max_nr_fragments is None or max_nr_fragments >= 0
+        assert xml_file.encoding == XmlFileWriter.encoding, "code error: all sinks must have the same encoding"
+        self.sinks.append((xml_file, max_nr_fragments))
+
+    @property
+    def accepts_fragments(self) -> bool:
+        """False if no sink accepts more fragments (so rendering more fragments is useless)."""
+        return any(max_nr is None or self.nr_fragments < max_nr for _, max_nr in self.sinks)
+
+    def write(self, text: str) -> None:
+        data = text.encode(XmlFileWriter.encoding)
+        for xml_file, _ in self.sinks:
+            xml_file.write_bytes(data=data)
+
+    def write_fragment(self, fragment: str) -> None:
+        data = fragment.encode(XmlFileWriter.encoding)
+        for xml_file, max_nr in self.sinks:
+            if max_nr is None or self.nr_fragments < max_nr:
+                xml_file.write_bytes(data=data)
+        self.nr_fragments += 1
+
+    def close(self) -> None:
+        for xml_file, _ in self.sinks:
+            xml_file.close()
@@ -1,8 +1,11 @@
 from converter import constants
-from converter.convert import ConvertCsvToXml
+from converter.staging import LocalStagingCopy
 from logging.handlers import RotatingFileHandler
+from pathlib import Path
 
+import argparse
 import converter.utils
+import importlib.util
 import logging
 import sys
 
@@ -17,6 +20,60 @@ def check_python_version():
     raise AssertionError(f"your python version = {major}.{minor}. Please use python 3.{minor_min} to 3.{minor_max}")
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Validate and convert a peilmarges .csv to a FEWS WIS .xml")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="nr of worker processes that validate the .csv and render the .xml (default 1: no worker processes)",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="use a compact memory layout for the .csv data (same output, less memory)",
+    )
+    parser.add_argument(
+        "--pyarrow",
+        action="store_true",
+        help="read the .csv with the multi-threaded csv reader of pyarrow (same output, requires pyarrow)",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="load the parsed .csv from a local cache if the .csv did not change since the last run (same output)",
+    )
+    parser.add_argument(
+        "--local-copy",
+        action="store_true",
+        help="read the .csv from a verified local copy, that is only copied again if the .csv changed",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="read the .csv in chunks, so that memory use does not depend on the size of the .csv",
+    )
+    parser.add_argument(
+        "--collect-all-errors",
+        action="store_true",
+        help="report rows with invalid season dates in orig_with_errors.csv, instead of stopping at the first one",
+    )
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error(f"--workers must be >= 1, but found {args.workers}")
+    if args.streaming and args.workers > 1:
+        parser.error("--streaming can not be combined with --workers")
+    if args.streaming and args.compact:
+        parser.error("--streaming can not be combined with --compact")
+    if args.streaming and args.pyarrow:
+        parser.error("--streaming can not be combined with --pyarrow")
+    if args.streaming and args.cache:
+        parser.error("--streaming can not be combined with --cache")
+    if args.pyarrow and importlib.util.find_spec("pyarrow") is None:
+        parser.error("--pyarrow requires 'pip install pyarrow'")
+    return args
+
+
 def setup_logging() -> None:
     """Adds 2 configured handlers to the root logger: stream, log_rotating_file."""
 
@@ -53,8 +110,28 @@ def setup_logging() -> None:
     root_logger.info("setup logging done")
 
 
+def get_data_converter(args: argparse.Namespace, csv_path: Path):
+    """The converters are imported here, not on top, so that starting the app (e.g. --help) does not import pandas."""
+    if args.streaming:
+        from converter.streaming import StreamingConvertCsvToXml
+
+        return StreamingConvertCsvToXml(orig_csv_path=csv_path, collect_all_errors=args.collect_all_errors)
+    from converter.convert import ConvertCsvToXml
+
+    csv_engine = "pyarrow" if args.pyarrow else "pandas"
+    return ConvertCsvToXml(
+        orig_csv_path=csv_path,
+        workers=args.workers,
+        compact=args.compact,
+        csv_engine=csv_engine,
+        use_cache=args.cache,
+        collect_all_errors=args.collect_all_errors,
+    )
+
+
 if __name__ == "__main__":
     check_python_version()
+    args = parse_args()
     setup_logging()
     logger = logging.getLogger(__name__)
 
@@ -63,6 +140,8 @@ if __name__ == "__main__":
         if constants.PEILMARGE_GIS_EXPORT_FILE_PATH
         else converter.utils.get_last_gis_export_peilmarges_csv()
     )
-    data_converter = ConvertCsvToXml(orig_csv_path=csv_path)
+    if args.local_copy:
+        csv_path = LocalStagingCopy().stage(source_path=csv_path)
+    data_converter = get_data_converter(args=args, csv_path=csv_path)
     data_converter.run()
     logger.info("shutting down app")